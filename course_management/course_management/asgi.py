@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "course_management.settings")
+# Every request runs its database code in its own thread, where a persistent
+# connection would never be reused (see DATABASES in settings.py)
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
@@ -10,9 +10,15 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,22 +49,50 @@ INSTALLED_APPS = [
     'drf_yasg',
 ]
 
+# Bearer token scheme of the API, the default reads the user from the token claims
+API_AUTHENTICATION_CLASS = os.getenv("API_AUTHENTICATION_CLASS", "courses.authentication.StatelessJWTAuthentication")
+
+# Authentication classes of each kind of route, see courses.authentication.authentication_policy().
+# API routes only accept the bearer token; the API documentation also accepts the session of
+# a user logged into the admin (which authenticates with sessions on its own)
+AUTHENTICATION_POLICIES = {
+    "api": [API_AUTHENTICATION_CLASS],
+    "docs": ["rest_framework.authentication.SessionAuthentication", API_AUTHENTICATION_CLASS],
+}
+
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication'
-    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': AUTHENTICATION_POLICIES["api"],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # Same output as DRF's JSONRenderer, encoded with orjson when it is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'courses.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Keyset pagination on every list endpoint, see courses/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'courses.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=2),
+    # Claims are not re-read until the token is refreshed, keep them short lived
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
+    # Tokens carry the user's flags and roles, see courses/authentication.py
+    'TOKEN_OBTAIN_SERIALIZER': 'courses.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'courses.authentication.ClaimsTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'courses.authentication.ClaimsUser',
 }
 
+# Cache holding revoked tokens. It must be shared by every worker (Redis, Memcached...)
+# for revocations to apply everywhere
+AUTH_CACHE_ALIAS = "default"
+
 MIDDLEWARE = [
+    # First, so its timings cover the whole request (see courses/instrumentation.py)
+    "courses.instrumentation.InstrumentationMiddleware",
+    # Sends the reads of GET requests to the read replicas (see courses/routers.py)
+    "courses.routers.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -68,6 +102,14 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Instrumentation: Server-Timing response headers, the number of identical queries in
+# a request reported as a possible N+1, and the bearer token required to scrape
+# /metrics. Behind a reverse proxy every client has the proxy's address, so access
+# is not granted by address; without METRICS_TOKEN the endpoint is disabled.
+SERVER_TIMING = os.getenv("SERVER_TIMING", str(DEBUG)).lower() == "true"
+N_PLUS_ONE_THRESHOLD = 5
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 ROOT_URLCONF = "course_management.urls"
 
 TEMPLATES = [
@@ -92,17 +134,84 @@ WSGI_APPLICATION = "course_management.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connection settings are read from the environment (.env), the defaults are the
+# local development server. Connections are kept open between requests for
+# DB_CONN_MAX_AGE seconds ("0" opens one per request, "none" never closes them) and
+# checked before being reused after an idle period (DB_CONN_HEALTH_CHECKS).
+#
+# Persistent connections belong to a thread, so under ASGI (asgi.py) the default is
+# one connection per request. There, DB_POOL=true enables Django's connection pool,
+# which only exists for PostgreSQL; MySQL deployments need a pooler in front of the
+# database (ProxySQL...) instead.
+
+DB_ENGINE = os.getenv("DB_ENGINE", "django.db.backends.mysql")
+DB_CONN_MAX_AGE = os.getenv("DB_CONN_MAX_AGE", "60").lower()
+DB_POOL = os.getenv("DB_POOL", "false").lower() == "true"
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": "course_management",
-        "USER" : "admin",
-        "PASSWORD":"1234",
-        "HOST":"localhost",
-        "PORT":"3307",
+        "ENGINE": DB_ENGINE,
+        "NAME": os.getenv("DB_NAME", "course_management"),
+        "USER": os.getenv("DB_USER", "admin"),
+        "PASSWORD": os.getenv("DB_PASSWORD", "1234"),
+        "HOST": os.getenv("DB_HOST", "localhost"),
+        "PORT": os.getenv("DB_PORT", "3307"),
+        "CONN_MAX_AGE": None if DB_CONN_MAX_AGE == "none" else int(DB_CONN_MAX_AGE),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "true").lower() == "true",
+        "OPTIONS": {},
     }
 }
 
+if DB_POOL:
+    if DB_ENGINE != "django.db.backends.postgresql":
+        raise ImproperlyConfigured("DB_POOL is only supported by django.db.backends.postgresql.")
+    # The pool replaces persistent connections, Django refuses both at once
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+    }
+
+# Read replicas of "default": DB_REPLICAS is a comma separated list of their hosts
+# (their files with SQLite), which get the aliases replica_1, replica_2... Reads of
+# GET requests are sent to them by courses.routers.ReplicaRouter. A client's reads
+# stay on the primary for DB_REPLICA_PIN_SECONDS after it writes, and replicas
+# behind by more than DB_REPLICA_MAX_LAG seconds ("none" skips the check) are not
+# used until they catch up. Tests read the primary (TEST MIRROR).
+
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), 1):
+    alias = f"replica_{index}"
+    DATABASES[alias] = dict(DATABASES["default"], OPTIONS=dict(DATABASES["default"]["OPTIONS"]), TEST={"MIRROR": "default"})
+    DATABASES[alias]["NAME" if DB_ENGINE == "django.db.backends.sqlite3" else "HOST"] = replica.strip()
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["courses.routers.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", "5"))
+DB_REPLICA_MAX_LAG = os.getenv("DB_REPLICA_MAX_LAG", "5").lower()
+REPLICA_MAX_LAG = None if DB_REPLICA_MAX_LAG == "none" else float(DB_REPLICA_MAX_LAG)
+REPLICA_LAG_CHECK_INTERVAL = 5
+# Must be shared by every worker process with replicas (check --deploy fails otherwise)
+REPLICA_PIN_CACHE_ALIAS = "default"
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; any other backend can be plugged in with CACHE_BACKEND
+# and CACHE_LOCATION (e.g. django.core.cache.backends.redis.RedisCache, redis://localhost:6379)
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "course-management"),
+    }
+}
+
+# Cache used for the category and course API payloads, and how long they are kept
+API_CACHE_ALIAS = "default"
+API_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,16 +254,31 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-import os
-
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
 SUPERUSER_USERNAME = os.getenv('SUPERUSER_USERNAME')
 SUPERUSER_EMAIL = os.getenv('SUPERUSER_EMAIL')
-SUPERUSER_PASSWORD = os.getenv('SUPERUSER_PASSWORD')
\ No newline at end of file
+SUPERUSER_PASSWORD = os.getenv('SUPERUSER_PASSWORD')
+
+# Seconds before the in-memory course suggestions index is rebuilt from the database
+SUGGESTIONS_INDEX_TTL = 300
+
+# Change feed entries younger than this are held back, so transactions still
+# running when a consumer reads the feed cannot commit below its cursor
+CHANGE_FEED_SETTLE_SECONDS = 2
+
+# Per-process cache of user group names used by the permission classes
+ROLE_CACHE_TTL = 60
+ROLE_CACHE_MAXSIZE = 10000
+
+# Query budget checked by views using QueryBudgetMixin. Views without their own
+# budget use QUERY_BUDGET_DEFAULT (None disables the check). Requests over budget
+# are logged, or raise QueryBudgetExceeded when QUERY_BUDGET_RAISE is True.
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_RAISE = False
+
+# Processes used to hash passwords by the import_users command (None: one per CPU).
+# The /api/users/bulk/ endpoint always hashes in the web worker
+USER_IMPORT_WORKERS = None
@@ -23,6 +23,9 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from courses.authentication import authentication_policy
+from courses.instrumentation import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Course Manager API",
@@ -34,6 +37,7 @@ schema_view = get_schema_view(
     ),
     public=True,
     permission_classes=(permissions.AllowAny,),
+    authentication_classes=authentication_policy("docs"),
 )
 
 urlpatterns = [
@@ -43,6 +47,7 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 from django.conf import settings
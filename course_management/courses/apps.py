@@ -7,3 +7,7 @@ class CoursesConfig(AppConfig):
 
     def ready(self):
         import courses.signals
+        import courses.checks
+        from django.db.backends.signals import connection_created
+        from .instrumentation import install_query_recorder
+        connection_created.connect(install_query_recorder)
@@ -0,0 +1,167 @@
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import ClaimsUser, get_auth_cache, is_revoked, revocation_keys, trusts_claims
+from .fast_serializers import get_values_serializer
+from .filters import CourseFilterBackend, StudentFilterBackend
+from .models import Category, Course, Student
+from .pagination import KeysetPagination
+from .queries import optimize_for_serializer
+from .renderers import FastJSONRenderer
+from .serializers import CategorySerializer, CourseSerializer, StudentSerializer
+from .suggestions import suggestion_index, aensure_index_built, aget_suggestions, parse_page_params
+
+
+# Async versions of the read endpoints, served under /api/async/ when running on
+# an ASGI server (uvicorn course_management.asgi:application).
+#
+# DRF views are sync only, so these are plain Django async views. They return the
+# same payloads as their DRF counterparts, reading the database with the async ORM
+# (aget/afirst/aiterator/aexists) and authenticating the JWT bearer token without
+# leaving the event loop (from its claims, see authentication.py).
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+def error_response(detail, status):
+    return json_response({"detail": detail}, status=status)
+
+
+async def aauthenticate(request):
+    """Return the active user of the request's JWT bearer token, or None."""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        token = AccessToken(parts[1])
+    except TokenError:
+        return None
+    if is_revoked(token, await get_auth_cache().aget_many(revocation_keys(token))):
+        return None
+    if trusts_claims(token):
+        return ClaimsUser(token)
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    return await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}, is_active=True).afirst()
+
+
+class AsyncAPIView(View):
+    authentication_required = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.authentication_required and await aauthenticate(request) is None:
+            return error_response("Authentication credentials were not provided.", 401)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return json_response(exc.detail, status=exc.status_code)
+
+
+class AsyncListView(AsyncAPIView):
+    serializer_class = None
+    filter_backends = ()
+    ordering = None
+    ordering_fields = None
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        self.kwargs = kwargs
+        drf_request = Request(request)
+        queryset = self.get_queryset()
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(drf_request, queryset, self)
+
+        # Same fast path as ValuesListMixin
+        values_serializer = get_values_serializer(self.serializer_class)
+        rows = values_serializer.values(queryset, extra=self.ordering_fields or ())
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(rows, drf_request, self)
+        data = await values_serializer.ato_representation(page)
+        return json_response(paginator.get_paginated_data(data))
+
+
+class AsyncDetailView(AsyncAPIView):
+    serializer_class = None
+    model = None
+
+    async def get(self, request, pk):
+        serializer = self.serializer_class(context={'request': request})
+        queryset = optimize_for_serializer(self.model.objects.all(), serializer)
+        try:
+            instance = await queryset.aget(pk=pk)
+        except self.model.DoesNotExist:
+            return error_response("No %s matches the given query." % self.model._meta.object_name, 404)
+        return json_response(self.serializer_class(instance, context={'request': request}).data)
+
+
+###############
+#   CATEGORY  #
+###############
+
+class AsyncCategoryListView(AsyncListView):
+    serializer_class = CategorySerializer
+    ordering_fields = ('id', 'name', 'course_count')
+
+    def get_queryset(self):
+        return Category.objects.all()
+
+class AsyncCategoryRetrieveView(AsyncDetailView):
+    serializer_class = CategorySerializer
+    model = Category
+
+
+###############
+#   COURSES   #
+###############
+
+# Course reads are public, like CourseViewSet
+class AsyncCourseListView(AsyncListView):
+    authentication_required = False
+    serializer_class = CourseSerializer
+    filter_backends = (CourseFilterBackend,)
+    ordering_fields = ('id', 'start_date', 'end_date', 'name', 'enrollment_count')
+
+    def get_queryset(self):
+        return Course.objects.all()
+
+class AsyncCourseRetrieveView(AsyncDetailView):
+    authentication_required = False
+    serializer_class = CourseSerializer
+    model = Course
+
+class AsyncStudentListView(AsyncListView):
+    serializer_class = StudentSerializer
+    filter_backends = (StudentFilterBackend,)
+    ordering_fields = ('id', 'created_at')
+
+    def get_queryset(self):
+        return Student.objects.filter(course_id=self.kwargs['course_id'])
+
+
+class AsyncSuggestionsView(AsyncAPIView):
+    async def get(self, request, user_id):
+        limit, offset = parse_page_params(request.GET)
+
+        await aensure_index_built()
+        if not suggestion_index.enrolled_courses(user_id, build=False):
+            if not await User.objects.filter(id=user_id).aexists():
+                return error_response("User not found.", 404)
+            return error_response("User is not enrolled in any of the courses.", 404)
+
+        total, suggested_courses_list = await aget_suggestions(user_id, limit, offset)
+        if not total:
+            return error_response("No course suggestions found.", 404)
+
+        return json_response({
+            "count": total,
+            "limit": limit,
+            "offset": offset,
+            "suggested_courses": suggested_courses_list,
+        })
@@ -0,0 +1,165 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .cache import is_process_local
+
+ROLES_CLAIM = "roles"
+
+
+# Routes pick their authentication classes by policy name ("api", "docs"...), so
+# the schemes of every route are configured in one place
+def authentication_policy(name):
+    """Return the authentication classes of `name` in settings.AUTHENTICATION_POLICIES."""
+    return [import_string(path) for path in settings.AUTHENTICATION_POLICIES[name]]
+
+
+# Stateless JWT authentication.
+#
+# Tokens issued by /api/token/ carry the user's username, is_staff, is_superuser
+# and group names ("roles") as claims. StatelessJWTAuthentication builds the
+# request user from those claims, so authenticated requests run no query for the
+# user or its groups. Tokens issued before the claims existed fall back to
+# loading the user from the database.
+#
+# Since claims are not re-read, revocation is checked against the cache on every
+# request (AUTH_CACHE_ALIAS, which must be shared by all workers in production):
+#   - a denylist of token ids, filled by /api/token/revoke/,
+#   - a per-user "not before" time, set by the signals in signals.py when the
+#     user's groups, flags or password change, or the user is deleted. Access
+#     tokens issued before it are rejected and clients get fresh claims from
+#     /api/token/refresh/, which reads the user again,
+#   - a second "not before" time for refresh tokens, only set when the password
+#     changes: role changes keep the sessions, a new password ends them.
+# Token times have a resolution of one second.
+#
+# Revocations written to a process-local cache (locmem, dummy) are not seen by
+# the other workers, so with such a cache the claims are not trusted and the user
+# is loaded from the database on every request, as JWTAuthentication does. Logged
+# out tokens are then still only denylisted in one worker until they expire,
+# which the short ACCESS_TOKEN_LIFETIME bounds (see checks.py).
+
+def get_auth_cache_alias():
+    return getattr(settings, 'AUTH_CACHE_ALIAS', 'default')
+
+def get_auth_cache():
+    return caches[get_auth_cache_alias()]
+
+def trusts_claims(token):
+    """True when the request user can be built from the claims of `token`."""
+    return ROLES_CLAIM in token and not is_process_local(get_auth_cache_alias())
+
+def _max_lifetime():
+    lifetimes = (jwt_settings.ACCESS_TOKEN_LIFETIME, jwt_settings.REFRESH_TOKEN_LIFETIME)
+    return int(max(lifetimes).total_seconds())
+
+def _denylist_key(jti):
+    return f"auth:deny:{jti}"
+
+def _not_before_key(user_id):
+    return f"auth:nbf:{user_id}"
+
+def _refresh_not_before_key(user_id):
+    return f"auth:refresh-nbf:{user_id}"
+
+
+def revoke_token(token):
+    """Reject `token` until it expires."""
+    remaining = token['exp'] - int(time.time())
+    if remaining > 0:
+        get_auth_cache().set(_denylist_key(token[jwt_settings.JTI_CLAIM]), True, remaining)
+
+def revoke_user_tokens(*user_ids, refresh=False):
+    """Reject the access tokens issued to these users until now, and the refresh tokens too with `refresh`."""
+    now = int(time.time())
+    values = {_not_before_key(user_id): now for user_id in user_ids}
+    if refresh:
+        values.update({_refresh_not_before_key(user_id): now for user_id in user_ids})
+    get_auth_cache().set_many(values, _max_lifetime())
+
+def revocation_keys(token):
+    return [_denylist_key(token.get(jwt_settings.JTI_CLAIM)), _not_before_key(token.get(jwt_settings.USER_ID_CLAIM))]
+
+def is_revoked(token, values):
+    """Check `token` against `values`, the cache entries of revocation_keys(token)."""
+    denylist_key, not_before_key = revocation_keys(token)
+    return denylist_key in values or token.get('iat', 0) < values.get(not_before_key, 0)
+
+
+def add_user_claims(token, user):
+    token['username'] = user.get_username()
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token[ROLES_CLAIM] = sorted(user.groups.values_list('name', flat=True))
+    return token
+
+
+# Request user built from the token claims. roles.get_user_roles() reads the
+# `_roles` attribute, so permission checks do not query the groups either.
+class ClaimsUser(TokenUser):
+    @cached_property
+    def _roles(self):
+        return frozenset(self.token.get(ROLES_CLAIM, ()))
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token, get_auth_cache().get_many(revocation_keys(token))):
+            raise InvalidToken("Token has been revoked.")
+        return token
+
+    def get_user(self, validated_token):
+        if not trusts_claims(validated_token):
+            return super().get_user(validated_token)
+        if jwt_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return ClaimsUser(validated_token)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+# Issues access tokens with the current claims of the user, instead of copying
+# the ones of the refresh token, so role changes are picked up on refresh.
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        denylist_key = _denylist_key(refresh.get(jwt_settings.JTI_CLAIM))
+        not_before_key = _refresh_not_before_key(refresh.get(jwt_settings.USER_ID_CLAIM))
+        values = get_auth_cache().get_many([denylist_key, not_before_key])
+        if denylist_key in values or refresh.get('iat', 0) < values.get(not_before_key, 0):
+            raise InvalidToken("Token has been revoked.")
+
+        user = User.objects.filter(
+            **{jwt_settings.USER_ID_FIELD: refresh.get(jwt_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        access = refresh.access_token
+        # access_token copies the iat of the refresh token, which predates the revocations
+        access.set_iat()
+        data = {'access': str(add_user_claims(access, user))}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
@@ -0,0 +1,458 @@
+import json
+import math
+import random
+import statistics
+import subprocess
+import time
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, RequestFactory
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .authentication import ClaimsTokenObtainPairSerializer, authentication_policy
+from .counters import reconcile_counters
+from .search import rebuild_index
+from .similarity import build_similarities
+from .models import Category, Course, Student
+from .queries import QueryCounter
+from .roles import get_group, PROFESSORS, STUDENTS
+
+PASSWORD = "benchmark"
+
+DEFAULT_SCALE = {
+    "users": 1000,
+    "professors": 50,
+    "courses": 200,
+    "categories": 30,
+    "enrollments": 5000,
+}
+
+
+###############
+#    DATA     #
+###############
+
+def seed(users, professors, courses, categories, enrollments, seed_value=0):
+    """
+    Fill the current database with synthetic data using bulk inserts.
+    Every user shares the same password hash, so seeding does not hash
+    thousands of passwords. Returns the ids the routes need.
+    """
+    rng = random.Random(seed_value)
+    password = make_password(PASSWORD)
+
+    existing = Category.objects.count()
+    Category.objects.bulk_create(
+        [Category(name=f"bench_category_{i}") for i in range(max(categories - existing, 0))],
+        ignore_conflicts=True,
+    )
+    category_ids = list(Category.objects.values_list("id", flat=True))
+
+    User.objects.bulk_create([
+        User(username=f"bench_professor_{i}", password=password) for i in range(professors)
+    ] + [
+        User(username=f"bench_student_{i}", password=password) for i in range(users)
+    ])
+    professor_ids = list(User.objects.filter(username__startswith="bench_professor_").values_list("id", flat=True))
+    student_ids = list(User.objects.filter(username__startswith="bench_student_").values_list("id", flat=True))
+
+    through = User.groups.through
+    professors_group, students_group = get_group(PROFESSORS), get_group(STUDENTS)
+    through.objects.bulk_create(
+        [through(user_id=user_id, group_id=professors_group.id) for user_id in professor_ids]
+        + [through(user_id=user_id, group_id=students_group.id) for user_id in student_ids],
+        ignore_conflicts=True,
+    )
+
+    start = date(2025, 9, 1)
+    Course.objects.bulk_create([
+        Course(
+            name=f"Bench course {i}",
+            description=f"Synthetic course number {i} " * 5,
+            professor_id_id=rng.choice(professor_ids),
+            start_date=start + timedelta(days=rng.randrange(365)),
+            end_date=start + timedelta(days=365 + rng.randrange(365)),
+        )
+        for i in range(courses)
+    ])
+    course_ids = list(Course.objects.filter(name__startswith="Bench course ").values_list("id", flat=True))
+
+    memberships = Course.categories.through
+    memberships.objects.bulk_create([
+        memberships(course_id=course_id, category_id=category_id)
+        for course_id in course_ids
+        for category_id in rng.sample(category_ids, min(3, len(category_ids)))
+    ], ignore_conflicts=True)
+
+    pairs = set()
+    while len(pairs) < min(enrollments, len(student_ids) * len(course_ids)):
+        pairs.add((rng.choice(student_ids), rng.choice(course_ids)))
+    Student.objects.bulk_create(
+        [Student(user_id=user_id, course_id=course_id) for user_id, course_id in pairs],
+        batch_size=1000,
+    )
+    # bulk_create skips the counter and search index receivers
+    reconcile_counters()
+    rebuild_index()
+    # Co-enrollment neighbors read by the suggestions route
+    build_similarities()
+
+    return {
+        "professor_ids": professor_ids,
+        "student_ids": student_ids,
+        "course_ids": course_ids,
+        "category_ids": category_ids,
+        "enrolled_user_ids": sorted({user_id for user_id, _ in pairs}),
+    }
+
+
+###############
+#   ROUTES    #
+###############
+
+# A benchmarked request. `build(context, i)` returns (path, body) for iteration i,
+# or (path, body, headers) to send its own headers instead of the administrator's
+# token, and runs before the timer starts, so it may create the objects the request needs.
+# Routes dominated by password hashing cap their iterations with `max_iterations`.
+class Route:
+    def __init__(self, name, method, build, status=200, content_type="application/json", max_iterations=None):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.status = status
+        self.content_type = content_type
+        self.max_iterations = max_iterations
+
+
+def _pick(context, key, i):
+    ids = context[key]
+    return ids[i % len(ids)]
+
+def _new_course(context, i):
+    course = Course.objects.create(
+        name=f"Bench disposable {i}",
+        description="Disposable",
+        professor_id_id=_pick(context, "professor_ids", i),
+        start_date=date(2025, 9, 1),
+        end_date=date(2026, 6, 30),
+    )
+    return course.id
+
+def _new_user(context, i):
+    return User.objects.create(username=f"bench_disposable_{context['run']}_{i}").id
+
+def _course_body(context, i):
+    return {
+        "name": f"Bench created {i}",
+        "description": "Created by the benchmark",
+        "professor_id": _pick(context, "professor_ids", i),
+        "start_date": "2025-09-01",
+        "end_date": "2026-06-30",
+        "categories": context["category_ids"][:3],
+    }
+
+def _revocable_tokens(context, i):
+    # A token pair of its own, revoking the administrator's would end the run
+    user = User.objects.create(username=f"bench_revoke_{context['run']}_{i}")
+    refresh = ClaimsTokenObtainPairSerializer.get_token(user)
+    return "/api/token/revoke/", {"refresh": str(refresh)}, {"Authorization": f"Bearer {refresh.access_token}"}
+
+def _student_enrollment(context, i):
+    course_id = _new_course(context, i)
+    student = Student.objects.create(user_id=_pick(context, "student_ids", i), course_id=course_id)
+    return f"/api/courses/{course_id}/students/{student.id}/", None
+
+
+ROUTES = [
+    Route("token_obtain", "post", lambda c, i: (
+        "/api/token/", {"username": "bench_professor_0", "password": PASSWORD}
+    ), max_iterations=10),
+    Route("token_refresh", "post", lambda c, i: ("/api/token/refresh/", {"refresh": c["refresh"]})),
+    Route("api_root", "get", lambda c, i: ("/api/", None)),
+    Route("users_list", "get", lambda c, i: ("/api/users/", None)),
+    Route("users_create", "post", lambda c, i: ("/api/users/", {
+        "username": f"bench_new_{c['run']}_{i}", "email": "bench@example.com",
+        "password": PASSWORD, "is_professor": False,
+    }), status=201, max_iterations=10),
+    Route("users_bulk", "post", lambda c, i: ("/api/users/bulk/", [
+        {"username": f"bench_bulk_{c['run']}_{i}_{n}", "password": PASSWORD} for n in range(10)
+    ]), max_iterations=3),
+    Route("user_detail", "get", lambda c, i: (f"/api/users/{_pick(c, 'student_ids', i)}/", None)),
+    Route("user_delete", "delete", lambda c, i: (f"/api/users/{_new_user(c, i)}/", None), status=204),
+    Route("user_password", "put", lambda c, i: (
+        f"/api/users/{_new_user(c, i)}/password/", {"new_password": "changed"}
+    ), max_iterations=10),
+    Route("suggestions", "get", lambda c, i: (f"/api/users/{_pick(c, 'enrolled_user_ids', i)}/suggestions/", None)),
+    Route("categories_list", "get", lambda c, i: ("/api/categories/", None)),
+    Route("category_detail", "get", lambda c, i: (f"/api/categories/{_pick(c, 'category_ids', i)}/", None)),
+    Route("courses_list", "get", lambda c, i: ("/api/courses/", None)),
+    Route("courses_popular", "get", lambda c, i: ("/api/courses/?ordering=-enrollment_count", None)),
+    Route("courses_search", "get", lambda c, i: (f"/api/courses/search/?q=synthetic+cou&category={_pick(c, 'category_ids', i)}", None)),
+    Route("courses_create", "post", lambda c, i: ("/api/courses/", _course_body(c, i)), status=201),
+    Route("course_detail", "get", lambda c, i: (f"/api/courses/{_pick(c, 'course_ids', i)}/", None)),
+    Route("course_update", "put", lambda c, i: (f"/api/courses/{_pick(c, 'course_ids', i)}/", _course_body(c, i))),
+    Route("course_delete", "delete", lambda c, i: (f"/api/courses/{_new_course(c, i)}/", None), status=204),
+    Route("students_list", "get", lambda c, i: (f"/api/courses/{_pick(c, 'course_ids', i)}/students/", None)),
+    Route("students_create", "post", lambda c, i: (
+        f"/api/courses/{_new_course(c, i)}/students/", {"user": _pick(c, "student_ids", i)}
+    ), status=201),
+    Route("students_bulk", "post", lambda c, i: (
+        f"/api/courses/{_new_course(c, i)}/students/bulk/", c["student_ids"][:100]
+    )),
+    Route("students_export", "get", lambda c, i: (f"/api/courses/{_pick(c, 'course_ids', i)}/students/export/", None)),
+    Route("enrollments_export_csv", "get", lambda c, i: ("/api/students/export/?format=csv", None), max_iterations=10),
+    Route("student_delete", "delete", _student_enrollment, status=204),
+    Route("token_revoke", "post", _revocable_tokens, status=204),
+    Route("changes", "get", lambda c, i: ("/api/changes/?since=0", None)),
+    Route("async_categories_list", "get", lambda c, i: ("/api/async/categories/", None)),
+    Route("async_category_detail", "get", lambda c, i: (f"/api/async/categories/{_pick(c, 'category_ids', i)}/", None)),
+    Route("async_courses_list", "get", lambda c, i: ("/api/async/courses/", None)),
+    Route("async_course_detail", "get", lambda c, i: (f"/api/async/courses/{_pick(c, 'course_ids', i)}/", None)),
+    Route("async_students_list", "get", lambda c, i: (f"/api/async/courses/{_pick(c, 'course_ids', i)}/students/", None)),
+    Route("async_suggestions", "get", lambda c, i: (
+        f"/api/async/users/{_pick(c, 'enrolled_user_ids', i)}/suggestions/", None
+    )),
+]
+
+
+###############
+#   RUNNER    #
+###############
+
+def percentile(values, percent):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(durations, queries, errors):
+    total = sum(durations)
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "p50_ms": round(percentile(durations, 50) * 1000, 3),
+        "p95_ms": round(percentile(durations, 95) * 1000, 3),
+        "p99_ms": round(percentile(durations, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "rps": round(len(durations) / total, 1) if total else None,
+        "queries_per_request": round(statistics.mean(queries), 2),
+    }
+
+def authenticate(client, username="bench_professor_0"):
+    """Log in through the JWT endpoint, returns (access, refresh)."""
+    response = client.post("/api/token/", {"username": username, "password": PASSWORD}, content_type="application/json")
+    if response.status_code != 200:
+        raise RuntimeError(f"Could not obtain a token for {username}: {response.status_code}")
+    return response.json()["access"], response.json()["refresh"]
+
+
+def timed(send):
+    """Call send() and return (response, seconds, queries)."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        started = time.perf_counter()
+        response = send()
+        if response.streaming:
+            # Streamed bodies are produced while they are read
+            b"".join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    return response, elapsed, counter.count
+
+
+def run_route(client, route, context, iterations, warmup, headers):
+    durations, queries, errors = [], [], 0
+    if route.max_iterations:
+        iterations = min(iterations, route.max_iterations)
+        warmup = min(warmup, 1)
+    for i in range(warmup + iterations):
+        path, body, *own_headers = route.build(context, i)
+        kwargs = {"headers": own_headers[0] if own_headers else headers}
+        if body is not None:
+            kwargs.update(data=json.dumps(body), content_type=route.content_type)
+
+        response, elapsed, count = timed(lambda: getattr(client, route.method)(path, **kwargs))
+
+        if i < warmup:
+            continue
+        durations.append(elapsed)
+        queries.append(count)
+        if response.status_code != route.status:
+            errors += 1
+    return summarize(durations, queries, errors)
+
+
+def run_benchmark(context, routes=ROUTES, iterations=50, warmup=5, only=None, progress=None):
+    """
+    Drive every route `iterations` times (after `warmup` untimed requests) with a
+    JWT authenticated administrator and return the statistics per route.
+    """
+    client = Client()
+    User.objects.filter(username="bench_professor_0").update(is_staff=True)
+    access, refresh = authenticate(client)
+    context = dict(context, refresh=refresh, run=int(time.time() * 1000))
+    headers = {"Authorization": f"Bearer {access}"}
+
+    results = {}
+    for route in routes:
+        if only and route.name not in only:
+            continue
+        results[route.name] = run_route(client, route, context, iterations, warmup, headers)
+        if progress is not None:
+            progress(route.name, results[route.name])
+    return results
+
+
+# Authentication stacks compared by run_auth_benchmark(). "session+token+jwt" is
+# the stack every API route used to run, "jwt" the bearer scheme loading the user
+# from the database.
+def auth_stacks():
+    return {
+        "session+token+jwt": [SessionAuthentication, TokenAuthentication, JWTAuthentication],
+        "jwt": [JWTAuthentication],
+        "api policy": authentication_policy("api"),
+    }
+
+
+def run_auth_benchmark(context, stacks=None, iterations=200, warmup=20, progress=None):
+    """
+    Measure the cost of each authentication stack on a cheap cached read
+    (GET /api/categories/<id>/), with a bearer token alone and with the bearer
+    token plus the session cookie of a user logged into the admin, as a browser
+    would send both. The request goes through the session and authentication
+    middlewares and the view only, so the difference between stacks is the
+    authentication work.
+    """
+    from .views import CategoryRetrieveView
+
+    client = Client()
+    access, _ = authenticate(client)
+    client.force_login(User.objects.get(username="bench_professor_0"))
+    session = client.cookies[settings.SESSION_COOKIE_NAME].value
+    category_id = context["category_ids"][0]
+    scenarios = {
+        "bearer": {"HTTP_AUTHORIZATION": f"Bearer {access}"},
+        "bearer+session": {"HTTP_AUTHORIZATION": f"Bearer {access}", "HTTP_COOKIE": f"{settings.SESSION_COOKIE_NAME}={session}"},
+    }
+
+    factory = RequestFactory()
+    results = {}
+    for stack_name, classes in (stacks or auth_stacks()).items():
+        view = CategoryRetrieveView.as_view(authentication_classes=classes)
+        handler = SessionMiddleware(AuthenticationMiddleware(lambda request: view(request, pk=category_id)))
+        for scenario, headers in scenarios.items():
+            durations, queries, errors = [], [], 0
+            for i in range(warmup + iterations):
+                request = factory.get(f"/api/categories/{category_id}/", **headers)
+                response, elapsed, count = timed(lambda: handler(request))
+                if i < warmup:
+                    continue
+                durations.append(elapsed)
+                queries.append(count)
+                errors += response.status_code != 200
+            name = f"{stack_name} ({scenario})"
+            results[name] = summarize(durations, queries, errors)
+            if progress is not None:
+                progress(name, results[name])
+    return results
+
+
+# Connection settings compared by run_connection_benchmark(): (CONN_MAX_AGE, CONN_HEALTH_CHECKS)
+CONNECTION_PROFILES = {
+    "per request": (0, False),
+    "persistent": (600, False),
+    "persistent+checks": (600, True),
+}
+
+
+def run_connection_benchmark(context, profiles=CONNECTION_PROFILES, iterations=100, warmup=5, progress=None):
+    """
+    Measure the connection overhead of each profile on a read that always runs
+    queries (GET /api/courses/<id>/students/). The test client never closes
+    connections, so each request is wrapped in close_old_connections() like the
+    request_started/request_finished handlers do. The "connects" statistic is the
+    number of new connections per request. An in-memory SQLite database is never
+    closed, so use a file or MySQL to see the difference.
+    """
+    client = Client()
+    access, _ = authenticate(client)
+    headers = {"Authorization": f"Bearer {access}"}
+    path = f"/api/courses/{context['course_ids'][0]}/students/"
+
+    connects = []
+    def count_connect(sender, connection, **kwargs):
+        connects.append(connection.alias)
+
+    default = connections["default"]
+    saved = {key: default.settings_dict[key] for key in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS")}
+    connection_created.connect(count_connect)
+    results = {}
+    try:
+        for name, (max_age, health_checks) in profiles.items():
+            default.settings_dict.update(CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=health_checks)
+            # Start from a connection opened with the profile's settings
+            default.close()
+            durations, queries, errors = [], [], 0
+            connects.clear()
+
+            def request():
+                close_old_connections()
+                response = client.get(path, headers=headers)
+                close_old_connections()
+                return response
+
+            for i in range(warmup + iterations):
+                if i == warmup:
+                    connects.clear()
+                response, elapsed, count = timed(request)
+                if i < warmup:
+                    continue
+                durations.append(elapsed)
+                queries.append(count)
+                errors += response.status_code != 200
+            results[name] = dict(summarize(durations, queries, errors), connects=round(len(connects) / iterations, 2))
+            if progress is not None:
+                progress(name, results[name])
+    finally:
+        connection_created.disconnect(count_connect)
+        default.settings_dict.update(saved)
+        default.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, metrics=("p50_ms", "p95_ms", "queries_per_request")):
+    """
+    Return [(route, metric, before, after, change %), ...] for the routes present
+    in both result sets. Positive changes are regressions.
+    """
+    rows = []
+    for route, stats in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else math.inf)
+            rows.append((route, metric, old, new, change))
+    return rows
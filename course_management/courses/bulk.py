@@ -0,0 +1,276 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator, MaxLengthValidator
+from django.db import IntegrityError, connection, transaction
+
+from .models import Student
+from .roles import get_group, role_cache, PROFESSORS, STUDENTS
+from .signals import enrollments_bulk_created
+
+ENROLLMENT_CHUNK_SIZE = 1000
+USER_BATCH_SIZE = 500
+
+CREATED = "created"
+ALREADY_ENROLLED = "already_enrolled"
+DUPLICATE = "duplicate"
+NOT_FOUND = "user_not_found"
+INVALID = "invalid"
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def _max_user_id():
+    # Larger ids overflow the column (a database error instead of "not found")
+    return connection.ops.integer_field_range(User._meta.pk.get_internal_type())[1]
+
+def _to_user_id(value):
+    # JSON true is not user 1, and 1.9 is not user 1 either
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        user_id = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return user_id if 0 < user_id <= _max_user_id() else None
+
+
+def _insert_enrollments(course, user_ids):
+    """
+    Insert the enrollments of `user_ids` in `course` and return the ids inserted.
+    Users enrolled (or deleted) by a concurrent request in the meantime make the
+    bulk INSERT fail, the rows are then inserted one by one to find them.
+    """
+    try:
+        with transaction.atomic():
+            Student.objects.bulk_create([Student(user_id=user_id, course=course) for user_id in user_ids])
+        return set(user_ids)
+    except IntegrityError:
+        pass
+    inserted = set()
+    for user_id in user_ids:
+        try:
+            with transaction.atomic():
+                # bulk_create, like the batch: enrollments_bulk_created reports them
+                Student.objects.bulk_create([Student(user_id=user_id, course=course)])
+        except IntegrityError:
+            continue
+        inserted.add(user_id)
+    return inserted
+
+
+def enroll_users(course, user_ids, chunk_size=ENROLLMENT_CHUNK_SIZE):
+    """
+    Enroll many users in `course` with set-based queries.
+
+    Each chunk of ids costs one query to check the users exist, one to find the
+    ones already enrolled and one bulk INSERT, all inside a single transaction.
+    Only the rows this call inserted are reported as created.
+    Returns one {"user": ..., "status": ...} result per submitted id, in order.
+    """
+    results = []
+    seen = set()
+    created = []
+
+    with transaction.atomic():
+        for chunk in _chunks(user_ids, chunk_size):
+            ids = {user_id for user_id in map(_to_user_id, chunk) if user_id is not None} - seen
+            existing = set(User.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+            enrolled = set(
+                Student.objects.filter(course=course, user_id__in=existing).values_list('user_id', flat=True)
+            ) if existing else set()
+
+            new = _insert_enrollments(course, sorted(existing - enrolled))
+            missed = existing - enrolled - new
+            if missed:
+                # Enrolled by a concurrent request since the check, or deleted
+                enrolled |= set(
+                    Student.objects.filter(course=course, user_id__in=missed).values_list('user_id', flat=True)
+                )
+            created.extend(sorted(new))
+
+            for value in chunk:
+                user_id = _to_user_id(value)
+                if user_id is None:
+                    status = INVALID
+                elif user_id in seen:
+                    status = DUPLICATE
+                elif user_id in new:
+                    status = CREATED
+                elif user_id in enrolled:
+                    status = ALREADY_ENROLLED
+                else:
+                    status = NOT_FOUND
+                if user_id is not None:
+                    seen.add(user_id)
+                results.append({"user": user_id if user_id is not None else value, "status": status})
+
+        if created:
+            # bulk_create does not send post_save, let the index/counter receivers know
+            enrollments_bulk_created.send(sender=Student, course=course, user_ids=created)
+
+    return results
+
+
+###############
+#    USERS    #
+###############
+
+EXISTS = "exists"
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+
+
+def _init_hasher():
+    # Worker processes started with "spawn" need Django configured before hashing
+    if not apps.ready:
+        django.setup()
+
+def password_hasher(workers=None):
+    """
+    Return a process pool to hash passwords with, or None to hash them in the
+    current process (workers=1). Defaults to settings.USER_IMPORT_WORKERS, then
+    to the number of CPUs.
+    """
+    workers = workers or getattr(settings, 'USER_IMPORT_WORKERS', None) or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_hasher)
+
+def _hash_passwords(passwords, executor):
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    # Hashing one password takes far longer than sending it to a worker
+    return list(executor.map(make_password, passwords, chunksize=8))
+
+def _is_true(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _validate_user_row(row, username):
+    """Return the error messages of `row`, the same rules as the User model and AUTH_PASSWORD_VALIDATORS."""
+    password = row.get("password")
+    if not username or not password:
+        return ["username and password are required."]
+    errors = []
+    email = str(row.get("email") or "").strip()
+    checks = [
+        (username, [User.username_validator, MaxLengthValidator(User._meta.get_field('username').max_length)]),
+        (email, [EmailValidator(), MaxLengthValidator(User._meta.get_field('email').max_length)] if email else []),
+    ]
+    for value, validators in checks:
+        for validator in validators:
+            try:
+                validator(value)
+            except ValidationError as exc:
+                errors.extend(exc.messages)
+    if not errors:
+        try:
+            validate_password(str(password), User(username=username, email=email))
+        except ValidationError as exc:
+            errors.extend(exc.messages)
+    return errors
+
+
+def import_user_batch(rows, executor=None):
+    """
+    Create the users described by `rows` (dicts with username, email, password
+    and is_professor) and add them to their group.
+
+    Passwords are hashed on `executor`, users and group memberships are inserted
+    with bulk_create in one transaction, so a batch is either fully imported or
+    not at all. Rows failing the username, email or password rules are reported
+    as invalid, with an "error". Usernames that already exist are skipped, which
+    makes re-running a batch safe. Returns one {"username": ..., "status": ...}
+    result per row.
+    """
+    results = []
+    valid = []
+    seen = set()
+    for row in rows:
+        username = str(row.get("username") or "").strip()
+        errors = _validate_user_row(row, username)
+        if errors:
+            results.append({"username": username, "status": INVALID, "error": " ".join(errors)})
+        elif username.lower() in seen:
+            # Usernames differing in case only collide on case-insensitive collations (MySQL)
+            results.append({"username": username, "status": DUPLICATE})
+        else:
+            seen.add(username.lower())
+            valid.append(row)
+            results.append({"username": username, "status": CREATED})
+
+    usernames = [str(row["username"]).strip() for row in valid]
+    existing = {
+        username.lower() for username in User.objects.filter(username__in=usernames).values_list('username', flat=True)
+    } if usernames else set()
+    for result in results:
+        if result["status"] == CREATED and result["username"].lower() in existing:
+            result["status"] = EXISTS
+    rows = [row for row in valid if str(row["username"]).strip().lower() not in existing]
+    if not rows:
+        return results
+
+    hashed = _hash_passwords([str(row["password"]) for row in rows], executor)
+    users = [
+        User(username=str(row["username"]).strip(), email=str(row.get("email") or "").strip(), password=password)
+        for row, password in zip(rows, hashed)
+    ]
+    professors, students = get_group(PROFESSORS), get_group(STUDENTS)
+
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # MySQL does not return the primary keys of bulk inserted rows
+        ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+        User.groups.through.objects.bulk_create([
+            User.groups.through(
+                user_id=ids[str(row["username"]).strip()],
+                group_id=(professors if _is_true(row.get("is_professor")) else students).id,
+            )
+            for row in rows
+        ], ignore_conflicts=True)
+
+    role_cache.invalidate(*ids.values())
+    return results
+
+
+def import_users(rows, batch_size=USER_BATCH_SIZE, workers=None, start_batch=0, progress=None):
+    """
+    Import users from an iterable of rows in batches of `batch_size`.
+
+    Batches before `start_batch` are skipped, so an interrupted import can be
+    resumed. `progress(batch, results)` is called after every committed batch.
+    Returns a summary {status: count}.
+    """
+    summary = {}
+    rows = iter(rows)
+    for _ in range(start_batch):
+        if not list(islice(rows, batch_size)):
+            return summary
+
+    executor = password_hasher(workers)
+    try:
+        batch = start_batch
+        for chunk in _chunks(rows, batch_size):
+            results = import_user_batch(chunk, executor)
+            for result in results:
+                summary[result["status"]] = summary.get(result["status"], 0) + 1
+            if progress is not None:
+                progress(batch, results)
+            batch += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return summary
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.utils.encoders import JSONEncoder
+
+CATEGORIES = "categories"
+COURSES = "courses"
+
+
+# Cache of serialized API payloads.
+#
+# Keys embed three counters kept in the cache itself, so invalidating never has
+# to find the keys of every cached variant (page, filters, ordering...):
+#   - the namespace version, bumped when everything in it is stale
+#     (a category rename changes the category names embedded in every course),
+#   - the list version, bumped on any change in the namespace,
+#   - the object version, bumped when that object changes.
+# Stale entries are never read again and expire on their own. Counters start from
+# the current time in milliseconds, so a counter that was evicted and created
+# again never points back to old entries.
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+def is_process_local(alias):
+    """True when the `alias` cache is not shared between worker processes."""
+    return isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+def get_timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+def _counter_key(namespace, name):
+    return f"api:{namespace}:{name}:version"
+
+def _get_versions(namespace, pk):
+    names = ["all", "list" if pk is None else f"obj:{pk}"]
+    keys = [_counter_key(namespace, name) for name in names]
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+def _initial_version():
+    return int(time.time() * 1000)
+
+def _bump(namespace, name):
+    cache = get_cache()
+    key = _counter_key(namespace, name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing (evicted or never read)
+        cache.set(key, _initial_version(), None)
+
+def invalidate_object(namespace, pk):
+    _bump(namespace, f"obj:{pk}")
+    _bump(namespace, "list")
+
+def invalidate_list(namespace):
+    _bump(namespace, "list")
+
+def invalidate_namespace(namespace):
+    _bump(namespace, "all")
+
+
+def build_key(namespace, request, pk=None):
+    """
+    Key for the payload of `request`. The host and query string are part of it,
+    as paginated payloads contain absolute links and depend on the filters.
+    """
+    all_version, version = _get_versions(namespace, pk)
+    variant = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"api:{namespace}:{all_version}:{'list' if pk is None else pk}:{version}:{variant}"
+
+def compute_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':')).encode()
+    return '"%s"' % hashlib.md5(payload).hexdigest()
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
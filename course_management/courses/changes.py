@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+
+from .models import Category, ChangeLog, ChangeLogPrune, Course, Student
+
+COURSE = 'course'
+CATEGORY = 'category'
+STUDENT = 'student'
+COURSE_CATEGORY = 'course_category'
+MODELS = (COURSE, CATEGORY, STUDENT, COURSE_CATEGORY)
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+# Change feed (delta sync).
+#
+# Every change to a course, category or enrollment, and every category added to
+# or removed from a course, appends a ChangeLog entry from the receivers in
+# signals.py, in the same transaction as the change. Consumers read the entries
+# after the cursor they saw last (?since=) and only transfer what changed:
+#   - created/updated entries carry the fields of the object after the change,
+#   - deleted entries are tombstones (data is None). The categories of a deleted
+#     course or category and the students of a deleted course go with it, the
+#     students also get their own tombstones,
+#   - course_category entries are created/deleted with {"course", "category"}.
+# Changes made without signals (bulk_create, update(), raw SQL) are not logged,
+# nor are the enrollment and course counters.
+#
+# Entry ids are handed out when a change is written, not when it commits, so a
+# long transaction can commit an entry below a cursor a consumer already has.
+# Entries younger than CHANGE_FEED_SETTLE_SECONDS are held back, and so is
+# everything after them. Ages are measured with the database clock (created_at
+# is set by the database), so workers with skewed clocks agree on them. This only
+# covers transactions that commit within CHANGE_FEED_SETTLE_SECONDS of writing
+# their entries: a longer one can still commit below a served cursor, and its
+# changes are missed by the consumers past it.
+#
+# prune_changes() records how far it deleted in ChangeLogPrune, cursors below that
+# watermark have missed changes. Ids are not contiguous (rolled back
+# transactions leave gaps), so the first entry left says nothing about it.
+
+def course_data(course):
+    return {
+        'id': course.pk,
+        'name': course.name,
+        'description': course.description,
+        'professor_id': course.professor_id_id,
+        'start_date': course.start_date,
+        'end_date': course.end_date,
+    }
+
+def category_data(category):
+    return {'id': category.pk, 'name': category.name}
+
+def student_data(student):
+    return {'id': student.pk, 'user': student.user_id, 'course': student.course_id, 'created_at': student.created_at}
+
+SNAPSHOTS = {Course: (COURSE, course_data), Category: (CATEGORY, category_data), Student: (STUDENT, student_data)}
+
+
+def record(instance, action, using='default'):
+    """Log `action` on `instance`, a Course, Category or Student."""
+    model, snapshot = SNAPSHOTS[type(instance)]
+    data = None if action == ChangeLog.DELETED else snapshot(instance)
+    ChangeLog.objects.using(using).create(model=model, object_id=instance.pk, action=action, data=data)
+
+def record_students(students, using='default'):
+    """Log the creation of `students`, inserted with bulk_create()."""
+    ChangeLog.objects.using(using).bulk_create([
+        ChangeLog(model=STUDENT, object_id=student.pk, action=ChangeLog.CREATED, data=student_data(student))
+        for student in students
+    ])
+
+def record_categories(categories, using='default'):
+    """Log the creation of `categories`, inserted with bulk_create()."""
+    ChangeLog.objects.using(using).bulk_create([
+        ChangeLog(model=CATEGORY, object_id=category.pk, action=ChangeLog.CREATED, data=category_data(category))
+        for category in categories
+    ])
+
+def record_course_categories(pairs, action, using='default'):
+    """Log categories added to (CREATED) or removed from (DELETED) courses, given (course id, category id) pairs."""
+    ChangeLog.objects.using(using).bulk_create([
+        ChangeLog(
+            model=COURSE_CATEGORY, object_id=course_id, action=action,
+            data={'course': course_id, 'category': category_id},
+        )
+        for course_id, category_id in sorted(pairs)
+    ])
+
+
+def _settled_before():
+    # Entries written before this database time are settled
+    return Now() - timedelta(seconds=getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', 0))
+
+def _last_id():
+    return ChangeLog.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+def latest_cursor():
+    """
+    Cursor to start following the feed from: the end of the settled prefix of the
+    log, so entries of transactions still in flight come after it.
+    """
+    unsettled = (
+        ChangeLog.objects.filter(created_at__gt=_settled_before())
+        .order_by('id').values_list('id', flat=True).first()
+    )
+    return _last_id() if unsettled is None else unsettled - 1
+
+def pruned_through():
+    """Id of the last entry deleted by prune_changes(), 0 when it never deleted any."""
+    return ChangeLogPrune.objects.order_by('-id').values_list('pruned_through', flat=True).first() or 0
+
+def is_expired(since):
+    """
+    True when entries after `since` were pruned (see prune_changes()), the
+    consumer has to pull everything again.
+    """
+    return since < pruned_through()
+
+def read_changes(since, limit=DEFAULT_LIMIT, models=None):
+    """
+    Return (entries, cursor, has_more): up to `limit` settled entries after the
+    `since` cursor, oldest first, and the cursor to read the next ones from.
+    """
+    queryset = ChangeLog.objects.filter(id__gt=since).order_by('id')
+    if models:
+        queryset = queryset.filter(model__in=models)
+    settled = ExpressionWrapper(Q(created_at__lte=_settled_before()), output_field=BooleanField())
+    queryset = queryset.annotate(settled=settled)
+    entries = list(queryset.values('id', 'model', 'object_id', 'action', 'data', 'settled')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    for index, entry in enumerate(entries):
+        if not entry['settled']:
+            entries, has_more = entries[:index], False
+            break
+
+    cursor = entries[-1]['id'] if entries else since
+    return [
+        {
+            'cursor': entry['id'],
+            'model': entry['model'],
+            'id': entry['object_id'],
+            'action': entry['action'],
+            'data': entry['data'],
+        }
+        for entry in entries
+    ], cursor, has_more
+
+def prune_changes(days):
+    """Delete the entries older than `days` days. Returns the number of entries deleted."""
+    cutoff = Now() - timedelta(days=days)
+    last = ChangeLog.objects.filter(created_at__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+    if last is None:
+        return 0
+    # Always keep the last entry, so the ids of a sequence reset on restart never go back
+    last = min(last, _last_id() - 1)
+    if last <= pruned_through():
+        return 0
+    with transaction.atomic():
+        deleted, _ = ChangeLog.objects.filter(id__lte=last).delete()
+        ChangeLogPrune.objects.create(pruned_through=last, deleted=deleted)
+    return deleted
@@ -0,0 +1,38 @@
+from django.core.checks import Error, Tags, Warning, register
+
+from .authentication import get_auth_cache_alias
+from .cache import is_process_local
+from .routers import get_pin_cache_alias, get_replicas
+
+
+# System checks of the settings that only work with a cache shared by every
+# worker process (`python manage.py check --deploy`)
+
+@register(Tags.security, deploy=True)
+def check_auth_cache(app_configs, **kwargs):
+    if not is_process_local(get_auth_cache_alias()):
+        return []
+    return [Warning(
+        "AUTH_CACHE_ALIAS uses a process-local cache backend.",
+        hint=(
+            "Token revocations are only seen by the worker that made them, so users are "
+            "loaded from the database on every request and logged out tokens keep working "
+            "on the other workers until they expire. Use a shared cache (Redis, Memcached...)."
+        ),
+        id="courses.W001",
+    )]
+
+
+@register(Tags.database, deploy=True)
+def check_replica_pin_cache(app_configs, **kwargs):
+    if not get_replicas() or not is_process_local(get_pin_cache_alias()):
+        return []
+    return [Error(
+        "REPLICA_PIN_CACHE_ALIAS uses a process-local cache backend.",
+        hint=(
+            "A client is only pinned to the primary by the worker that handled its write, "
+            "the other workers serve it stale reads from the replicas. Use a shared cache "
+            "(Redis, Memcached...)."
+        ),
+        id="courses.E001",
+    )]
@@ -0,0 +1,82 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Category, Course, Student
+from . import cache
+
+
+# Denormalized counters.
+#
+# Course.enrollment_count is moved with atomic "SET enrollment_count =
+# enrollment_count + n" updates when students are enrolled or removed, so
+# concurrent enrollments never overwrite each other. Category.course_count only
+# changes with course categories, it is recounted for the categories involved.
+# Both are written with update(), which sends no signals, so the cached payloads
+# are invalidated here, once the transaction commits. reconcile_counters() fixes any drift (raw SQL, bulk
+# deletes of users...).
+
+def _enrollments(course_ref):
+    return Coalesce(Subquery(
+        Student.objects.filter(course=course_ref).order_by().values('course')
+        .annotate(count=Count('pk')).values('count')
+    ), 0)
+
+def _courses(category_ref):
+    through = Course.categories.through
+    return Coalesce(Subquery(
+        through.objects.filter(category=category_ref).order_by().values('category')
+        .annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def add_enrollments(course_id, count):
+    """Add `count` (negative to subtract) to the enrollment count of a course."""
+    courses = Course.objects.filter(pk=course_id)
+    if count < 0:
+        # Counters are unsigned, a drifted counter is left for reconcile_counters()
+        courses = courses.filter(enrollment_count__gte=-count)
+    courses.update(enrollment_count=F('enrollment_count') + count)
+    transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, course_id))
+
+def recount_courses(category_ids):
+    """Recount the courses of these categories."""
+    category_ids = list(category_ids)
+    if not category_ids:
+        return
+    Category.objects.filter(pk__in=category_ids).update(course_count=_courses(OuterRef('pk')))
+    for category_id in category_ids:
+        transaction.on_commit(partial(cache.invalidate_object, cache.CATEGORIES, category_id))
+
+
+def reconcile_counters(dry_run=False):
+    """
+    Compare every counter with a fresh count and fix the ones that drifted, unless
+    `dry_run`. Returns {"courses": [(id, stored, actual)], "categories": [...]}.
+    """
+    drift = {
+        "courses": list(
+            Course.objects.annotate(actual=_enrollments(OuterRef('pk')))
+            .exclude(enrollment_count=F('actual'))
+            .values_list('pk', 'enrollment_count', 'actual')
+        ),
+        "categories": list(
+            Category.objects.annotate(actual=_courses(OuterRef('pk')))
+            .exclude(course_count=F('actual'))
+            .values_list('pk', 'course_count', 'actual')
+        ),
+    }
+    if not dry_run:
+        Course.objects.bulk_update(
+            [Course(pk=pk, enrollment_count=actual) for pk, _, actual in drift["courses"]], ['enrollment_count']
+        )
+        Category.objects.bulk_update(
+            [Category(pk=pk, course_count=actual) for pk, _, actual in drift["categories"]], ['course_count']
+        )
+        for pk, _, _ in drift["courses"]:
+            transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, pk))
+        for pk, _, _ in drift["categories"]:
+            transaction.on_commit(partial(cache.invalidate_object, cache.CATEGORIES, pk))
+    return drift
@@ -0,0 +1,207 @@
+from collections import defaultdict
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.db.models import F
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+
+# Read-only serialization straight from values() rows.
+#
+# A ModelSerializer builds its output by calling to_representation() on a bound
+# field for every attribute of every instance. ValuesSerializer compiles the
+# readable fields of a ModelSerializer class once into a list of
+# (key, column, converter) extractors, so rendering a row is a dict
+# comprehension over values() data, without model instances. The output is the
+# same as the serializer's.
+#
+# Supported fields are model columns, dotted sources through foreign keys
+# ('user.username'), primary key related fields, model serializers of a foreign
+# key (read in the same query, with a join) and one level of nested many=True
+# model serializers or primary key lists. Nested many values are read with one
+# extra query per field, like a prefetch. Any other field raises
+# ImproperlyConfigured when the serializer is compiled.
+#
+# `serializer_kwargs` are passed to the serializer class, e.g. the `fields` and
+# `expand` arguments of SparseFieldsSerializerMixin.
+class ValuesSerializer:
+    # Join column used to group nested rows by parent
+    parent_column = '_values_parent'
+
+    def __init__(self, serializer_class, **serializer_kwargs):
+        serializer = serializer_class(**serializer_kwargs)
+        self.model = serializer.Meta.model
+        self.pk_name = self.model._meta.pk.name
+        self.columns = [self.pk_name]
+        self.extractors = []
+        self.nested = []
+        self.related = []
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+                self.nested.append((name, self._compile_nested(name, field)))
+                self.extractors.append((name, None, None))
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                column, related = self._compile_related(name, field)
+                self.related.append((column, related))
+                self.columns.extend(column for column in related[0] if column not in self.columns)
+                self.extractors.append((name, column, None))
+                continue
+            column, converter = self._compile_field(name, field)
+            if column not in self.columns:
+                self.columns.append(column)
+            self.extractors.append((name, column, converter))
+
+    def _resolve(self, name, source):
+        """Return (column, model field) of a dotted `source`, following foreign keys."""
+        model, path, model_field = self.model, [], None
+        for attr in source.split('.'):
+            if model is None:
+                raise ImproperlyConfigured(f"Cannot compile field '{name}': '{source}' is not a column")
+            model_field = next((f for f in model._meta.get_fields() if f.name == attr), None)
+            if model_field is None or not model_field.concrete or model_field.many_to_many:
+                raise ImproperlyConfigured(f"Cannot compile field '{name}': '{source}' is not a column")
+            path.append(attr)
+            model = model_field.related_model if model_field.many_to_one or model_field.one_to_one else None
+        return '__'.join(path), model_field
+
+    def _compile_field(self, name, field):
+        if field.source == '*':
+            raise ImproperlyConfigured(f"Cannot compile field '{name}' with source='*'")
+        column, model_field = self._resolve(name, field.source)
+
+        if isinstance(field, PrimaryKeyRelatedField):
+            # values() already returns the primary key of the related object
+            if field.pk_field is not None:
+                return column, field.pk_field.to_representation
+            return column, None
+        if isinstance(field, serializers.RelatedField):
+            raise ImproperlyConfigured(f"Cannot compile related field '{name}' ({type(field).__name__})")
+
+        # Plain columns whose Python value is already what the field outputs
+        if type(field) is serializers.CharField and isinstance(model_field, (models.CharField, models.TextField)):
+            return column, None
+        if type(field) is serializers.IntegerField and isinstance(model_field, models.IntegerField):
+            return column, None
+        if type(field) is serializers.DateField and str(getattr(field, 'format', api_settings.DATE_FORMAT)).lower() == ISO_8601:
+            return column, _isoformat
+        return column, field.to_representation
+
+    def _compile_nested(self, name, field):
+        model_field = next((f for f in self.model._meta.get_fields() if f.name == field.source), None)
+        if model_field is None or not model_field.many_to_many or '.' in field.source:
+            raise ImproperlyConfigured(f"Cannot compile nested field '{name}': '{field.source}' is not a many to many field")
+        if isinstance(field, ManyRelatedField) and not isinstance(field.child_relation, PrimaryKeyRelatedField):
+            raise ImproperlyConfigured(f"Cannot compile related field '{name}' ({type(field.child_relation).__name__})")
+
+        child = get_values_serializer(type(field.child)) if isinstance(field, serializers.ListSerializer) else None
+        if child is not None and child.nested:
+            raise ImproperlyConfigured(f"Cannot compile nested field '{name}': only one level of nesting is supported")
+        related_model = model_field.related_model
+        # Name of the relation seen from the related model (Category -> 'courses')
+        if model_field.auto_created:
+            lookup = model_field.field.name
+        else:
+            lookup = model_field.related_query_name()
+        return related_model, lookup, child
+
+    def _compile_related(self, name, field):
+        column, model_field = self._resolve(name, field.source)
+        if not (model_field.many_to_one or model_field.one_to_one):
+            raise ImproperlyConfigured(f"Cannot compile nested field '{name}': '{field.source}' is not a foreign key")
+        child = get_values_serializer(type(field))
+        if child.nested or child.related:
+            raise ImproperlyConfigured(f"Cannot compile nested field '{name}': only one level of nesting is supported")
+        # The row gets the rendered object under `column` (see to_representation())
+        return f'_values_{name}', ([f'{column}__{child_column}' for child_column in child.columns], child)
+
+    # Rendering
+
+    def values(self, queryset, extra=()):
+        """Return the values() queryset with the columns needed by to_representation()."""
+        columns = self.columns + [name for name in extra if name not in self.columns]
+        return queryset.prefetch_related(None).values(*columns)
+
+    def nested_querysets(self, rows):
+        """Return [(field name, queryset), ...] of the nested values of `rows`."""
+        if not self.nested or not rows:
+            return []
+        ids = [row[self.pk_name] for row in rows]
+        querysets = []
+        for name, (related_model, lookup, child) in self.nested:
+            queryset = related_model.objects.filter(**{f'{lookup}__in': ids})
+            columns = child.columns if child else [related_model._meta.pk.name]
+            querysets.append((name, queryset.values(*columns, **{self.parent_column: F(lookup)})))
+        return querysets
+
+    def to_representation(self, rows, nested_rows=None):
+        """
+        Render `rows` (dicts from values()) as a list of dicts. `nested_rows` maps
+        each nested field to its evaluated nested_querysets() rows. They are read
+        here when not given.
+        """
+        if nested_rows is None:
+            nested_rows = {name: list(queryset) for name, queryset in self.nested_querysets(rows)}
+
+        nested = {}
+        for name, (related_model, lookup, child) in self.nested:
+            grouped = defaultdict(list)
+            related_rows = nested_rows.get(name, [])
+            if child is not None:
+                values = child.to_representation(related_rows)
+            else:
+                values = [related[related_model._meta.pk.name] for related in related_rows]
+            for related, value in zip(related_rows, values):
+                grouped[related[self.parent_column]].append(value)
+            nested[name] = grouped
+
+        for column, (columns, child) in self.related:
+            # Foreign key objects, None when the key is null
+            present = [row for row in rows if row[columns[0]] is not None]
+            for row in rows:
+                row[column] = None
+            values = child.to_representation(
+                [{child_column: row[prefixed] for child_column, prefixed in zip(child.columns, columns)} for row in present]
+            )
+            for row, value in zip(present, values):
+                row[column] = value
+
+        pk_name = self.pk_name
+        return [
+            {
+                key: (
+                    nested[key].get(row[pk_name], []) if column is None
+                    else row[column] if converter is None or row[column] is None
+                    else converter(row[column])
+                )
+                for key, column, converter in self.extractors
+            }
+            for row in rows
+        ]
+
+    async def ato_representation(self, rows):
+        """to_representation() for async views, the nested rows are read with aiterator()."""
+        nested_rows = {}
+        for name, queryset in self.nested_querysets(rows):
+            nested_rows[name] = [row async for row in queryset.aiterator()]
+        return self.to_representation(rows, nested_rows)
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+@lru_cache(maxsize=None)
+def get_values_serializer(serializer_class, fields=None, expand=None):
+    """
+    Compile `serializer_class` once per process and set of `fields` and `expand`
+    (frozensets, see SparseFieldsSerializerMixin).
+    """
+    kwargs = {key: value for key, value in (('fields', fields), ('expand', expand)) if value is not None}
+    return ValuesSerializer(serializer_class, **kwargs)
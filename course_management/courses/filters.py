@@ -0,0 +1,99 @@
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Course
+
+
+def _parse(request, name, parser, description):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    parsed = parser(value)
+    if parsed is None:
+        raise ValidationError({name: f"Enter a valid {description}."})
+    return parsed
+
+def _parse_id_list(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return [int(item) for item in value.split(',') if item]
+    except ValueError:
+        raise ValidationError({name: "Enter a comma separated list of ids."})
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def _safe_parse_date(value):
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+def _safe_parse_datetime(value):
+    try:
+        value = parse_datetime(value)
+    except ValueError:
+        return None
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+# Filters for the course list, all of them on indexed columns:
+#   ?start_date_after= / ?start_date_before=  (YYYY-MM-DD, inclusive)
+#   ?end_date_after= / ?end_date_before=
+#   ?category=1,2   courses in any of those categories
+#   ?professor=3
+class CourseFilterBackend(BaseFilterBackend):
+    date_filters = {
+        'start_date_after': 'start_date__gte',
+        'start_date_before': 'start_date__lte',
+        'end_date_after': 'end_date__gte',
+        'end_date_before': 'end_date__lte',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        for param, lookup in self.date_filters.items():
+            value = _parse(request, param, _safe_parse_date, "date (YYYY-MM-DD)")
+            if value is not None:
+                queryset = queryset.filter(**{lookup: value})
+
+        professor = _parse(request, 'professor', _parse_int, "user id")
+        if professor is not None:
+            queryset = queryset.filter(professor_id=professor)
+
+        categories = _parse_id_list(request, 'category')
+        if categories:
+            # EXISTS instead of a join, so a course matching several categories is returned once
+            memberships = Course.categories.through.objects.filter(course_id=OuterRef('pk'), category_id__in=categories)
+            queryset = queryset.filter(Exists(memberships))
+
+        return queryset
+
+
+# Filters for a course's student list:
+#   ?created_after= / ?created_before=  (ISO 8601 datetime, inclusive)
+#   ?user=10
+class StudentFilterBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        created_after = _parse(request, 'created_after', _safe_parse_datetime, "datetime")
+        if created_after is not None:
+            queryset = queryset.filter(created_at__gte=created_after)
+
+        created_before = _parse(request, 'created_before', _safe_parse_datetime, "datetime")
+        if created_before is not None:
+            queryset = queryset.filter(created_at__lte=created_before)
+
+        user = _parse(request, 'user', _parse_int, "user id")
+        if user is not None:
+            queryset = queryset.filter(user_id=user)
+
+        return queryset
@@ -0,0 +1,264 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Per request instrumentation.
+#
+# InstrumentationMiddleware creates a RequestMetrics for every request and keeps
+# it in a context variable, which sync_to_async copies to the threads running
+# async ORM queries. Every database connection gets the record_query() execute
+# wrapper when it is created, which adds the query count and time to the metrics
+# of the current request. Serializers and renderers add their time with timed().
+#
+# When the request ends the metrics are sent in a Server-Timing header
+# (settings.SERVER_TIMING) and added to the in-process aggregates served in the
+# Prometheus text format by metrics_view(). A query repeated at least
+# N_PLUS_ONE_THRESHOLD times in a request (same SQL, parameters apart) is logged
+# as a likely N+1 pattern and counted.
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.timings = {}
+        self._active = set()
+
+    def duplicate_queries(self, threshold):
+        return [(sql, count) for sql, count in self.statements.items() if count >= threshold]
+
+
+_current = ContextVar('request_metrics', default=None)
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the `name` timing of the current request."""
+    metrics = _current.get()
+    # Nested blocks of the same name (nested serializers) are only counted once
+    if metrics is None or name in metrics._active:
+        yield
+        return
+    metrics._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] = metrics.timings.get(name, 0.0) + time.perf_counter() - started
+        metrics._active.discard(name)
+
+
+# Serializer mixin timing to_representation() as "serialize"
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+_in_clause = re.compile(r'IN \((?:%s, )*%s\)')
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.statements[_in_clause.sub('IN (...)', sql)] += 1
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Receiver of connection_created. The wrappers survive reconnections, and it goes
+    # first so it is never the one popped by an execute_wrapper() block in progress
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    func = match.func
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    if view_class is None:
+        return getattr(func, '__name__', match.view_name)
+    # Viewsets: CourseViewSet.list, CourseViewSet.create...
+    actions = getattr(func, 'actions', None)
+    if actions and request.method.lower() in actions:
+        return f"{view_class.__name__}.{actions[request.method.lower()]}"
+    return view_class.__name__
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(lambda: {
+            'requests': Counter(),
+            'buckets': [0] * len(DURATION_BUCKETS),
+            'duration': 0.0,
+            'queries': 0,
+            'db_time': 0.0,
+            'serialize': 0.0,
+            'render': 0.0,
+            'response_bytes': 0,
+            'n_plus_one': 0,
+        })
+
+    def observe(self, view, method, status, duration, metrics, size, n_plus_one):
+        with self._lock:
+            stats = self._views[view]
+            stats['requests'][(method, status)] += 1
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][index] += 1
+            stats['duration'] += duration
+            stats['queries'] += metrics.queries
+            stats['db_time'] += metrics.db_time
+            stats['serialize'] += metrics.timings.get('serialize', 0.0)
+            stats['render'] += metrics.timings.get('render', 0.0)
+            stats['response_bytes'] += size
+            stats['n_plus_one'] += n_plus_one
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """Return the aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            views = sorted(
+                (view, dict(stats, requests=Counter(stats['requests']), buckets=list(stats['buckets'])))
+                for view, stats in self._views.items()
+            )
+
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{sample_name}{{{_labels(labels)}}} {_number(value)}" for sample_name, labels, value in samples)
+
+        metric('api_requests_total', 'counter', 'Requests handled, by view, method and status.', [
+            ('api_requests_total', {'view': view, 'method': method, 'status': status}, count)
+            for view, stats in views
+            for (method, status), count in sorted(stats['requests'].items())
+        ])
+
+        samples = []
+        for view, stats in views:
+            count = sum(stats['requests'].values())
+            for bound, bucket in zip(DURATION_BUCKETS, stats['buckets']):
+                samples.append(('api_request_duration_seconds_bucket', {'view': view, 'le': _number(bound)}, bucket))
+            samples.append(('api_request_duration_seconds_bucket', {'view': view, 'le': '+Inf'}, count))
+            samples.append(('api_request_duration_seconds_sum', {'view': view}, stats['duration']))
+            samples.append(('api_request_duration_seconds_count', {'view': view}, count))
+        metric('api_request_duration_seconds', 'histogram', 'Wall time of the requests, by view.', samples)
+
+        for name, key, help_text in [
+            ('api_db_queries_total', 'queries', 'Database queries run, by view.'),
+            ('api_db_duration_seconds_total', 'db_time', 'Time spent in database queries, by view.'),
+            ('api_serialize_duration_seconds_total', 'serialize', 'Time spent serializing, by view.'),
+            ('api_render_duration_seconds_total', 'render', 'Time spent rendering responses, by view.'),
+            ('api_response_bytes_total', 'response_bytes', 'Size of the response bodies, by view.'),
+            ('api_n_plus_one_total', 'n_plus_one', 'Requests repeating a query N_PLUS_ONE_THRESHOLD times or more, by view.'),
+        ]:
+            metric(name, 'counter', help_text, [(name, {'view': view}, stats[key]) for view, stats in views])
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        view = get_view_name(request)
+
+        threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+        duplicates = metrics.duplicate_queries(threshold) if threshold else []
+        for sql, count in duplicates:
+            logger.warning("Possible N+1 in %s (%s %s): query run %d times: %s",
+                           view, request.method, request.path, count, sql)
+
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, duration, metrics, size, int(bool(duplicates)))
+
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = self.server_timing(duration, metrics, duplicates)
+        return response
+
+    def server_timing(self, duration, metrics, duplicates):
+        entries = [
+            f'total;dur={duration * 1000:.2f}',
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+        ]
+        for name in ('serialize', 'render'):
+            if name in metrics.timings:
+                entries.append(f'{name};dur={metrics.timings[name] * 1000:.2f}')
+        if duplicates:
+            entries.append(f'n-plus-one;desc="{max(count for _, count in duplicates)} repeated queries"')
+        return ', '.join(entries)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, only answered with the METRICS_TOKEN bearer token."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token or not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
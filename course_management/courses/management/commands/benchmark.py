@@ -0,0 +1,109 @@
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from courses import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with synthetic data and measure latency, "
+        "throughput and queries per request of every API route. "
+        "Use --settings or the database settings to run it against SQLite or MySQL."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.DEFAULT_SCALE.items():
+            parser.add_argument(f"--{name}", type=int, default=default, help=f"Number of {name} to seed (default {default}).")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per route.")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per route before measuring.")
+        parser.add_argument("--route", action="append", dest="routes", help="Only run this route (repeatable).")
+        parser.add_argument("--auth", action="store_true", help="Also compare the cost of the authentication stacks.")
+        parser.add_argument("--connections", action="store_true", help="Also compare the connection overhead of persistent and per request connections.")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Baseline JSON file to compare the results with.")
+        parser.add_argument("--fail-over", type=float, help=(
+            "With --compare, exit with an error when the p95 latency or the queries per request "
+            "of a route grow by more than this percentage over the baseline."
+        ))
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Could not read the baseline: {error}")
+
+        scale = {name: options[name] for name in benchmark.DEFAULT_SCALE}
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for cache in caches.all():
+                cache.clear()
+            self.stdout.write(f"Seeding {', '.join(f'{count} {name}' for name, count in scale.items())}...")
+            context = benchmark.seed(**scale)
+            routes = benchmark.run_benchmark(
+                context,
+                iterations=options["iterations"],
+                warmup=options["warmup"],
+                only=options["routes"],
+                progress=self.report,
+            )
+            if options["auth"]:
+                self.stdout.write("\nAuthentication stacks:")
+                routes.update(benchmark.run_auth_benchmark(context, progress=self.report))
+            if options["connections"]:
+                self.stdout.write("\nDatabase connections:")
+                routes.update(benchmark.run_connection_benchmark(context, progress=self.report))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        results = {
+            "meta": {
+                "revision": benchmark.git_revision(),
+                "date": datetime.now(timezone.utc).isoformat(),
+                "database": connection.vendor,
+                "scale": scale,
+                "iterations": options["iterations"],
+            },
+            "routes": routes,
+        }
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self.compare(baseline, results, options["fail_over"])
+
+    def report(self, name, stats):
+        line = (
+            f"{name:<18} p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms  "
+            f"p99 {stats['p99_ms']:>8.2f} ms  {stats['rps']:>8} req/s  {stats['queries_per_request']:>6} queries"
+        )
+        if "connects" in stats:
+            line += f"  {stats['connects']:>5} connects"
+        if stats["errors"]:
+            line += f"  {stats['errors']} unexpected statuses"
+            self.stdout.write(self.style.WARNING(line))
+        else:
+            self.stdout.write(line)
+
+    def compare(self, baseline, results, fail_over):
+        self.stdout.write(f"\nCompared with {baseline.get('meta', {}).get('revision') or 'baseline'}:")
+        regressions = []
+        for route, metric, before, after, change in benchmark.compare(baseline, results):
+            line = f"{route:<18} {metric:<20} {before:>10} -> {after:>10}  {change:+.1f}%"
+            if change > 0 and metric != "p50_ms" and fail_over is not None and change > fail_over:
+                regressions.append(line)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} metrics regressed by more than {fail_over}%.")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.similarity import DEFAULT_TOP_K, build_similarities
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the most similar courses of every course from co-enrollment data "
+        "and store them for the course suggestions. With --incremental only the "
+        "courses affected by the enrollment changes since the last run are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help=f"Similar courses kept per course (default: {DEFAULT_TOP_K}).")
+        parser.add_argument("--min-common", type=int, default=1, help="Students two courses must share to be similar (default: 1).")
+        parser.add_argument("--incremental", action="store_true", help="Only recompute the courses affected since the last run.")
+
+    def handle(self, *args, **options):
+        if options["top_k"] < 1 or options["min_common"] < 1:
+            raise CommandError("--top-k and --min-common must be positive.")
+        build = build_similarities(options["top_k"], options["min_common"], options["incremental"])
+        kind = "incremental" if build.incremental else "full"
+        self.stdout.write(self.style.SUCCESS(f"{build.courses} courses recomputed ({kind} build)."))
@@ -0,0 +1,67 @@
+import csv
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.bulk import import_users, USER_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV (username,email,password,is_professor columns) or a JSON list file. "
+        "Passwords are hashed on a process pool and users are inserted in batches; "
+        "use --checkpoint to resume an interrupted import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file, '-' to read CSV from stdin.")
+        parser.add_argument("--batch-size", type=int, default=USER_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=None, help="Password hashing processes (default: CPU count).")
+        parser.add_argument("--start-batch", type=int, default=None, help="Skip the batches before this one.")
+        parser.add_argument("--checkpoint", help="File storing the next batch to import, read on start and updated after every batch.")
+
+    def read_rows(self, path):
+        if path == "-":
+            return csv.DictReader(sys.stdin)
+        path = Path(path)
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+        if path.suffix.lower() == ".json":
+            with path.open(encoding="utf-8") as file:
+                rows = json.load(file)
+            if not isinstance(rows, list):
+                raise CommandError("The JSON file must contain a list of users.")
+            return rows
+        return csv.DictReader(path.open(newline="", encoding="utf-8"))
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        checkpoint = Path(options["checkpoint"]) if options["checkpoint"] else None
+
+        start_batch = options["start_batch"]
+        if start_batch is None:
+            start_batch = int(checkpoint.read_text()) if checkpoint and checkpoint.exists() else 0
+        if start_batch:
+            self.stdout.write(f"Resuming from batch {start_batch}")
+
+        def progress(batch, results):
+            created = sum(1 for result in results if result["status"] == "created")
+            self.stdout.write(f"Batch {batch}: {created} created, {len(results) - created} skipped")
+            for result in results:
+                if "error" in result:
+                    self.stderr.write(f"  {result['username'] or '<no username>'}: {result['error']}")
+            if checkpoint:
+                checkpoint.write_text(str(batch + 1))
+
+        summary = import_users(
+            self.read_rows(options["path"]),
+            batch_size=batch_size,
+            workers=options["workers"],
+            start_batch=start_batch,
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Done: " + ", ".join(f"{count} {status}" for status, count in sorted(summary.items())) if summary else "Nothing to import."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from courses.changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the change feed entries older than --days days. Consumers whose "
+        "cursor is older get a 410 and have to pull everything again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Entries to keep, in days (default: 30).")
+
+    def handle(self, *args, **options):
+        deleted = prune_changes(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} changes deleted."))
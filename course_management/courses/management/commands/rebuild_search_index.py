@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from courses.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the course full-text search index again from the course table, after "
+        "changes that skip the model signals (bulk_create, raw SQL...). Only needed "
+        "with SQLite, MySQL keeps its FULLTEXT indexes by itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        rebuild_index(options["database"])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from courses.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the course enrollments and the courses of every category, and fix "
+        "the stored counters that drifted from the actual counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the counters that drifted.")
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(dry_run=options["dry_run"])
+        for label, rows in (("Course", drift["courses"]), ("Category", drift["categories"])):
+            for pk, stored, actual in rows:
+                self.stdout.write(f"{label} {pk}: {stored} -> {actual}")
+        total = len(drift["courses"]) + len(drift["categories"])
+        if options["dry_run"]:
+            self.stdout.write(f"{total} counters drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{total} counters fixed."))
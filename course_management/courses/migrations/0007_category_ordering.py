@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0006_course_student_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="category",
+            options={"ordering": ["id"]},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(model, column):
+    return Coalesce(Subquery(
+        model.objects.filter(**{column: OuterRef("pk")}).order_by().values(column)
+        .annotate(count=Count("pk")).values("count")
+    ), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model("courses", "Course")
+    Category = apps.get_model("courses", "Category")
+    Student = apps.get_model("courses", "Student")
+    db = schema_editor.connection.alias
+    Course.objects.using(db).update(enrollment_count=count_rows(Student, "course"))
+    Category.objects.using(db).update(course_count=count_rows(Course.categories.through, "category"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0007_category_ordering"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="course_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="enrollment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=models.Index(
+                fields=["enrollment_count", "id"], name="course_enrollment_count_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SEARCH_TABLE = "courses_course_search"
+
+
+# Full-text index of the course names and descriptions, see courses/search.py.
+# Native full-text indexes are not expressible with models.Index, so they are
+# created with SQL for the databases that have them.
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "name, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) "
+            "SELECT id, name, description FROM courses_course"
+        )
+    elif vendor == "mysql":
+        schema_editor.execute("ALTER TABLE courses_course ADD FULLTEXT INDEX course_name_ft (name)")
+        schema_editor.execute("ALTER TABLE courses_course ADD FULLTEXT INDEX course_text_ft (name, description)")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE {SEARCH_TABLE}")
+    elif vendor == "mysql":
+        schema_editor.execute("ALTER TABLE courses_course DROP INDEX course_name_ft, DROP INDEX course_text_ft")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0008_course_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
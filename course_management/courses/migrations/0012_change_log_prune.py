@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0011_course_similarity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogPrune",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pruned_through", models.PositiveBigIntegerField()),
+                ("deleted", models.PositiveIntegerField()),
+                ("pruned_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,111 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import build_key, compute_etag, etag_matches, get_cache, get_timeout
+from .fast_serializers import get_values_serializer
+from .instrumentation import timed
+from .queries import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Counts the database queries run while handling a request and reports the
+# request when it goes over `query_budget`.
+#
+# `query_budget` is either a number or a dict keyed by viewset action or lower
+# case HTTP method ({'list': 4, 'post': 10}). Views without a budget fall back to
+# settings.QUERY_BUDGET_DEFAULT. Over-budget requests are logged, or raise
+# QueryBudgetExceeded when settings.QUERY_BUDGET_RAISE is True (tests).
+class QueryBudgetMixin:
+    query_budget = None
+
+    def get_query_budget(self, request):
+        budget = self.query_budget
+        if isinstance(budget, dict):
+            budget = budget.get(getattr(self, 'action', None) or request.method.lower())
+        if budget is None:
+            budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        return budget
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = super().dispatch(request, *args, **kwargs)
+
+        # The viewset action is only known once the request has been dispatched
+        budget = self.get_query_budget(request)
+        if budget is not None and counter.count > budget:
+            message = "%s %s ran %d queries, budget is %d" % (request.method, request.path, counter.count, budget)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+# Read-through cache for list() and retrieve().
+#
+# Successful payloads are stored in the API cache under `cache_namespace` (see
+# cache.py) together with an ETag, so repeated reads skip the database and
+# serializer, and clients sending a matching If-None-Match get a 304.
+# Permissions are still checked on every request, before list()/retrieve() run.
+class CachedReadMixin:
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(request, lookup, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, lookup, view, *args, **kwargs):
+        cache = get_cache()
+        key = build_key(self.cache_namespace, request, lookup)
+        entry = cache.get(key)
+
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = (compute_etag(response.data), response.data)
+            cache.set(key, entry, get_timeout())
+
+        etag, data = entry
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+
+# Read-only fast path for list(): the page is read with values() and rendered by
+# a ValuesSerializer compiled from the view's serializer class (see
+# fast_serializers.py), with the same output as the serializer.
+class ValuesListMixin:
+    def get_values_serializer(self):
+        return get_values_serializer(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        # The paginator reads its ordering key from the rows
+        rows = values_serializer.values(queryset, extra=getattr(self, 'ordering_fields', None) or ())
+
+        page = self.paginate_queryset(rows)
+        if page is None:
+            page = list(rows)
+        with timed('serialize'):
+            data = values_serializer.to_representation(page)
+        if self.paginator is None:
+            return Response(data)
+        return self.get_paginated_response(data)
@@ -1,8 +1,16 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Now
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # Number of courses in the category, kept by the receivers in signals.py
+    course_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Deterministic order for the categories nested in courses
+        ordering = ['id']
 
     def __str__(self):
         return self.name
@@ -14,6 +22,18 @@ class Course(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     categories = models.ManyToManyField(Category, related_name='courses', blank=True)
+    # Number of enrolled students, kept by the receivers in signals.py
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Match the keyset pagination orderings (field, id) and the professor filter
+        indexes = [
+            models.Index(fields=['start_date', 'id'], name='course_start_date_idx'),
+            models.Index(fields=['end_date', 'id'], name='course_end_date_idx'),
+            models.Index(fields=['name', 'id'], name='course_name_idx'),
+            models.Index(fields=['professor_id', 'start_date', 'id'], name='course_professor_start_idx'),
+            models.Index(fields=['enrollment_count', 'id'], name='course_enrollment_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -25,9 +45,76 @@ class Student(models.Model):
 
     class Meta:
         unique_together = ('user', 'course')
+        indexes = [
+            # Students of a course ordered by enrollment date
+            models.Index(fields=['course', 'created_at', 'id'], name='student_course_created_idx'),
+        ]
 
     def __str__(self):
         user_str = self.user.username if self.user else "No User"
         course_str = self.course.name if self.course else "No Course"
         return f"{user_str} - {course_str}"
 
+
+# Append-only log of the changes to courses, categories, enrollments and course
+# categories, written by the receivers in signals.py and served by the change
+# feed (see changes.py). The id is the feed cursor.
+class ChangeLog(models.Model):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted')]
+
+    model = models.CharField(max_length=20)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTIONS)
+    # Fields of the object after the change, None for deleted objects
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    # Database clock, the same for every worker (see changes.read_changes())
+    created_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        indexes = [
+            # Feed of some models only (?models=course,student)
+            models.Index(fields=['model', 'id'], name='changelog_model_idx'),
+            models.Index(fields=['created_at'], name='changelog_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.model} {self.object_id} {self.action}"
+
+# Runs of prune_changes. Entries up to pruned_through were deleted, a cursor below
+# the last one has missed changes.
+class ChangeLogPrune(models.Model):
+    pruned_through = models.PositiveBigIntegerField()
+    deleted = models.PositiveIntegerField()
+    pruned_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.pruned_at}: through {self.pruned_through}"
+
+# Top-K most similar courses of every course by co-enrollment, computed offline
+# by the build_course_similarities command (see similarity.py) and merged into
+# the course suggestions
+class CourseSimilarity(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    similar_course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        # Also the index of the suggestions read (course_id IN ...)
+        unique_together = ('course', 'similar_course')
+
+    def __str__(self):
+        return f"{self.course_id} -> {self.similar_course_id}: {self.score:.3f}"
+
+# Runs of build_course_similarities. The change log cursor of the last run is
+# where an incremental refresh starts reading enrollment changes.
+class SimilarityBuild(models.Model):
+    cursor = models.PositiveBigIntegerField()
+    incremental = models.BooleanField()
+    courses = models.PositiveIntegerField()
+    built_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.built_at}: {self.courses} courses"
@@ -0,0 +1,183 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset (cursor) pagination.
+#
+# Pages are read with "WHERE (field, id) > (last field, last id) ORDER BY field, id
+# LIMIT n", so every page costs the same whatever its position and there is no
+# OFFSET at all. The ordering can be chosen with ?ordering= among the view's
+# `ordering_fields` (prefix with '-' for descending), the default being the view's
+# `ordering` or 'id'. The primary key is always used as tie breaker, so ordering
+# fields should be indexed together with it.
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same as paginate_queryset() for async views, the page is read with aiterator()
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([item async for item in page_queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the ordered and sliced queryset of the requested page, with one
+        extra row to know whether there is a next page.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+        self.cursor = self.decode_cursor(request)
+
+        # Walking backwards is the same query with the ordering flipped
+        descending = self.descending != self.is_reversed
+        order_by = [('-' if descending else '') + name for name in self.key_fields]
+        queryset = queryset.order_by(*order_by)
+
+        if self.cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(self.cursor['key'], descending))
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.is_reversed:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = results
+        return results
+
+    @property
+    def is_reversed(self):
+        return self.cursor is not None and self.cursor['reverse']
+
+    @property
+    def key_fields(self):
+        return [self.field] if self.field == 'id' else [self.field, 'id']
+
+    def keyset_filter(self, key, descending):
+        lookup = 'lt' if descending else 'gt'
+        if len(key) == 1:
+            return Q(**{f'{self.key_fields[0]}__{lookup}': key[0]})
+        field_value, id_value = key
+        return (
+            Q(**{f'{self.field}__{lookup}': field_value})
+            | Q(**{self.field: field_value, f'id__{lookup}': id_value})
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'A valid integer is required.'})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be positive.'})
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        default = getattr(view, 'ordering', None) or 'id'
+        allowed = getattr(view, 'ordering_fields', None) or (default.lstrip('-'),)
+        ordering = request.query_params.get(self.ordering_query_param, default)
+        field = ordering.lstrip('-')
+        if field not in allowed:
+            raise ValidationError({self.ordering_query_param: f"Ordering must be one of: {', '.join(allowed)}."})
+        return field, ordering.startswith('-')
+
+    def get_key(self, item):
+        if isinstance(item, dict):
+            return [item[name] for name in self.key_fields]
+        return [getattr(item, name) for name in self.key_fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            key, reverse = cursor['k'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(key, list) or len(key) != len(self.key_fields):
+            raise NotFound(self.invalid_cursor_message)
+        return {'key': key, 'reverse': reverse}
+
+    def encode_cursor(self, item, reverse):
+        payload = {'k': self.get_key(item)}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, default=_encode_key, separators=(',', ':')).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'The pagination cursor value.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results to return per page.', 'schema': {'type': 'integer'}},
+            {'name': self.ordering_query_param, 'required': False, 'in': 'query',
+             'description': 'Which field to use when ordering the results.', 'schema': {'type': 'string'}},
+        ]
+
+
+def _encode_key(value):
+    # Dates and datetimes keep their full precision, the ORM parses them back
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Cannot use {type(value).__name__} in a cursor")
@@ -0,0 +1,22 @@
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+from rest_framework.utils.mediatypes import media_type_matches
+
+
+# Parses a text/csv body into an iterator over its rows.
+# The body is decoded and split lazily, so large uploads are not loaded at once.
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return csv.reader(codecs.iterdecode(stream, encoding))
+
+
+def is_csv(request):
+    """True when the body of `request` is parsed by CSVParser, same match as DRF's negotiation."""
+    return media_type_matches(CSVParser.media_type, request.content_type or '')
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .roles import has_role, PROFESSORS, STUDENTS
+
 class IsAdminUserOrProfessorOrReadOnly(permissions.BasePermission):
     """
     Allow if the user is an administrator or a teacher.
@@ -8,19 +10,19 @@ class IsAdminUserOrProfessorOrReadOnly(permissions.BasePermission):
         if request.method in ['GET', 'HEAD', 'OPTIONS']:  
             return True
         
-        return request.user.is_staff or request.user.groups.filter(name="Professors").exists()
+        return request.user.is_staff or has_role(request.user, PROFESSORS)
 
 class IsProfessor(permissions.BasePermission):
     """
-    Permission for users in group 'Professor'.
+    Permission for users in group 'Professors'.
     """
 
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and request.user.groups.filter(name='Professor').exists()
+        return request.user and request.user.is_authenticated and has_role(request.user, PROFESSORS)
     
 class IsProfessorOrReadOnly(permissions.BasePermission):
     """
-    Allows read access to all authenticated users, but only users in the 'Professor' group can modify.
+    Allows read access to all authenticated users, but only users in the 'Professors' group can modify.
     """
 
     def has_permission(self, request, view):
@@ -29,14 +31,14 @@ class IsProfessorOrReadOnly(permissions.BasePermission):
             return request.user and request.user.is_authenticated
         
         # POST, PUT, DELETE
-        return request.user and request.user.is_authenticated and request.user.groups.filter(name='Professor').exists()    
+        return request.user and request.user.is_authenticated and has_role(request.user, PROFESSORS)
 
 class IsStudent(permissions.BasePermission):
     """
     Permission for users in group 'Students'
     """
     def has_permission(self, request, view):
-        return request.user and request.user.groups.filter(name='Students').exists()
+        return request.user and has_role(request.user, STUDENTS)
 
 class ReadOnlyForStudents(permissions.BasePermission):
     """
@@ -45,4 +47,4 @@ class ReadOnlyForStudents(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return request.user and not request.user.groups.filter(name='Students').exists()
\ No newline at end of file
+        return request.user and not has_role(request.user, STUDENTS)
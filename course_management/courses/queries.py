@@ -0,0 +1,111 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField
+
+
+def optimize_for_serializer(queryset, serializer):
+    """
+    Add the select_related, prefetch_related and only() calls needed to render
+    `serializer` for every object of `queryset` without extra queries.
+
+    Only readable fields are taken into account: nested many=True serializers and
+    many-related fields are prefetched, nested serializers of a foreign key and
+    dotted sources ('user.username') are followed with select_related and the
+    remaining model fields are loaded with only().
+    """
+    model = queryset.model
+    only = {model._meta.pk.name}
+    select = set()
+    prefetch = []
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        attrs = field.source.split('.')
+
+        if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+            related = _get_model_field(model, attrs[0])
+            if related is None:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                related_queryset = optimize_for_serializer(related.related_model.objects.all(), field.child)
+                prefetch.append(Prefetch(attrs[0], queryset=related_queryset))
+            else:
+                prefetch.append(attrs[0])
+            continue
+
+        model_field = _get_model_field(model, attrs[0])
+        if model_field is None or not model_field.concrete:
+            continue
+        only.add(attrs[0])
+        if isinstance(field, serializers.BaseSerializer) and model_field.is_relation:
+            select.add(attrs[0])
+            only.update(f'{attrs[0]}__{name}' for name in _serializer_columns(field))
+            continue
+        if len(attrs) > 1 and model_field.is_relation:
+            select.add(attrs[0])
+            only.add('__'.join(attrs[:2]))
+
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only)
+
+
+def iter_values_in_batches(queryset, fields, batch_size=2000):
+    """
+    Yield values_list(*fields) tuples of `queryset` ordered by primary key, reading
+    `batch_size` rows per query with "WHERE pk > last pk". Unlike iterator() this
+    keeps memory bounded on backends whose drivers buffer whole result sets
+    (MySQL), and no cursor stays open while the rows are consumed.
+    """
+    pk_name = queryset.model._meta.pk.name
+    fields = list(fields)
+    extra_pk = pk_name not in fields
+    if extra_pk:
+        fields.append(pk_name)
+    pk_index = fields.index(pk_name)
+
+    queryset = queryset.order_by(pk_name).values_list(*fields)
+    last_pk = None
+    while True:
+        batch_queryset = queryset if last_pk is None else queryset.filter(**{f'{pk_name}__gt': last_pk})
+        batch = list(batch_queryset[:batch_size])
+        if extra_pk:
+            yield from (row[:-1] for row in batch)
+        else:
+            yield from batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1][pk_index]
+
+
+def _serializer_columns(serializer):
+    """Model fields read by the plain readable fields of `serializer`."""
+    model = serializer.Meta.model
+    columns = {model._meta.pk.name}
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        model_field = _get_model_field(model, field.source)
+        if model_field is not None and model_field.concrete and not model_field.many_to_many:
+            columns.add(field.source)
+    return columns
+
+
+def _get_model_field(model, name):
+    for field in model._meta.get_fields():
+        if field.name == name:
+            return field
+    return None
+
+
+# execute_wrapper callable that counts the queries run through a connection
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
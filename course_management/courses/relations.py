@@ -0,0 +1,86 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.serializers import ListSerializer
+
+
+# Related fields validating their ids with one query.
+#
+# PrimaryKeyRelatedField fetches every submitted id with its own get(), so a
+# course with 50 categories or a list of 50 enrollments costs 50 queries.
+# BulkPrimaryKeyRelatedField loads all the ids of the request at once with
+# "pk IN (...)": every id of a many=True field, and the ids of the field in all
+# the items of a many=True parent serializer. The loaded objects are the
+# validated values, so save() reuses them. Errors and output are the same as
+# PrimaryKeyRelatedField's.
+class BulkManyRelatedField(ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.resolve(list(data))
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        return self.resolve([data])[0]
+
+    def to_pk(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, values):
+        """Return the objects of the submitted ids `values`, in order."""
+        pks = [self.to_pk(value) for value in values]
+        # Field instances belong to one serializer instance, so this is per request
+        loaded = self.__dict__.setdefault('_loaded', {})
+        missing = {pk for pk in pks if pk not in loaded}
+        if missing and not self.__dict__.get('_siblings_loaded'):
+            self._siblings_loaded = True
+            missing |= self.sibling_pks() - loaded.keys()
+        if missing:
+            loaded.update({obj.pk: obj for obj in self.get_queryset().filter(pk__in=missing)})
+            for pk in missing:
+                loaded.setdefault(pk, None)
+
+        objects = []
+        for value, pk in zip(values, pks):
+            if loaded[pk] is None:
+                self.fail('does_not_exist', pk_value=value)
+            objects.append(loaded[pk])
+        return objects
+
+    def sibling_pks(self):
+        """Valid ids of this field in every item of a many=True parent serializer."""
+        field = self.parent if isinstance(self.parent, ManyRelatedField) else self
+        serializer = field.parent
+        root = getattr(serializer, 'parent', None)
+        if not isinstance(root, ListSerializer) or not isinstance(getattr(root, 'initial_data', None), list):
+            return set()
+
+        pks = set()
+        for item in root.initial_data:
+            value = item.get(field.field_name) if isinstance(item, dict) else None
+            for candidate in (value if field is not self and isinstance(value, list) else [value]):
+                if candidate is None:
+                    continue
+                try:
+                    pks.add(self.to_pk(candidate))
+                except ValidationError:
+                    continue
+        return pks
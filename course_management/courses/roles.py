@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+
+
+PROFESSORS = "Professors"
+STUDENTS = "Students"
+
+
+# Process-wide LRU cache of group names keyed on user id, with a TTL.
+# Entries are dropped by the m2m_changed/post_delete receivers in signals.py
+# whenever a user's groups change, the TTL only bounds how long other worker
+# processes can serve stale roles.
+class RoleCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _ttl(self):
+        return getattr(settings, 'ROLE_CACHE_TTL', 60)
+
+    def _maxsize(self):
+        return getattr(settings, 'ROLE_CACHE_MAXSIZE', 10000)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            roles, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return roles
+
+    def set(self, user_id, roles):
+        ttl = self._ttl()
+        if not ttl:
+            return
+        with self._lock:
+            self._entries[user_id] = (roles, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._maxsize():
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+role_cache = RoleCache()
+
+
+def get_user_roles(user):
+    """
+    Return the group names of the user as a frozenset.
+
+    The result is stored on the user object, which DRF creates once per request,
+    so every permission class checked during a request shares a single lookup.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        roles = role_cache.get(user.pk)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            role_cache.set(user.pk, roles)
+        user._roles = roles
+    return roles
+
+
+def has_role(user, role):
+    return role in get_user_roles(user)
+
+
+# Group objects of the default roles, fetched once per process.
+# Cleared by signals.py when a group is saved or deleted.
+_groups = {}
+
+def get_group(name):
+    group = _groups.get(name)
+    if group is None:
+        group, _ = Group.objects.get_or_create(name=name)
+        _groups[name] = group
+    return group
+
+def clear_groups():
+    _groups.clear()
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+
+# Read replica routing.
+#
+# settings.REPLICA_DATABASES lists the aliases of databases replicating "default".
+# Reads made while handling a GET, HEAD or OPTIONS request go to a random replica,
+# everything else goes to the primary:
+#   - writes, reads inside a transaction and reads outside a request (management
+#     commands, signals of the seeding...),
+#   - any read of a request after its first write, and every read of other methods,
+#   - for REPLICA_PIN_SECONDS after a write, the reads of the same client (same
+#     Authorization header or session cookie), so it reads its own writes while
+#     the replicas catch up,
+#   - replicas lagging more than REPLICA_MAX_LAG seconds, or unreachable, are
+#     skipped for REPLICA_LAG_CHECK_INTERVAL seconds.
+# Pins are kept in the REPLICA_PIN_CACHE_ALIAS cache, which has to be shared by
+# every worker process (see checks.py).
+# Without replicas the router leaves every decision to Django. Payloads cached by
+# CachedReadMixin may be read from a replica, so they can be up to REPLICA_MAX_LAG
+# seconds older than the change that invalidated them.
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_routing', default=None)
+
+def _reset_state(token):
+    try:
+        _state.reset(token)
+    except ValueError:
+        # Closed from another context than the request's (ASGI servers)
+        _state.set(None)
+
+def get_replicas():
+    return getattr(settings, 'REPLICA_DATABASES', ())
+
+def get_pin_cache_alias():
+    return getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+
+def get_pin_cache():
+    return caches[get_pin_cache_alias()]
+
+def pin_key(request):
+    """Cache key of the primary pin of the client making `request`, None for anonymous clients."""
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return f"db:pin:{hashlib.sha256(credentials.encode()).hexdigest()}"
+
+
+def replica_lag(alias):
+    """Return the replication lag of `alias` in seconds, None when replication is stopped."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute("SHOW REPLICA STATUS")
+            row = cursor.fetchone()
+            if row is None:
+                # Not a replica of anything (local setups)
+                return 0
+            status = dict(zip([column[0] for column in cursor.description], row))
+            return status.get('Seconds_Behind_Source')
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )
+            return cursor.fetchone()[0]
+    return 0
+
+
+# Process-wide availability of each replica, checked at most once every
+# REPLICA_LAG_CHECK_INTERVAL seconds
+class ReplicaHealth:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def is_available(self, alias):
+        if getattr(settings, 'REPLICA_MAX_LAG', None) is None:
+            return True
+        with self._lock:
+            entry = self._checked.get(alias)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+        # Async views run their queries through sync_to_async, so routing never
+        # happens in the event loop and the check uses the connection of the thread
+        return self.check(alias)
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            logger.warning("Replica %s is unreachable, reading from the primary", alias, exc_info=True)
+            lag = None
+        available = lag is not None and lag <= settings.REPLICA_MAX_LAG
+        if lag is not None and not available:
+            logger.warning("Replica %s is %s seconds behind, reading from the primary", alias, lag)
+        with self._lock:
+            self._checked[alias] = (available, self._expiry())
+        return available
+
+    def _expiry(self):
+        return time.monotonic() + getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+
+    def clear(self):
+        with self._lock:
+            self._checked.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas:
+            return None
+        state = _state.get()
+        if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        available = [alias for alias in replicas if replica_health.is_available(alias)]
+        return random.choice(available) if available else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not get_replicas():
+            return None
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+        key = pin_key(request)
+        state = RoutingState(self.is_pinned(request, key and get_pin_cache().get(key)))
+        token = _state.set(state)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self.release(token, response)
+        if self.should_pin(key, state):
+            get_pin_cache().set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+        key = pin_key(request)
+        state = RoutingState(self.is_pinned(request, key and await get_pin_cache().aget(key)))
+        token = _state.set(state)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.release(token, response)
+        if self.should_pin(key, state):
+            await get_pin_cache().aset(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def release(self, token, response):
+        # Streamed bodies run their queries while the server reads them, after this
+        # middleware returns: keep routing them until the response is closed
+        if response is not None and response.streaming:
+            response._resource_closers.append(lambda: _reset_state(token))
+        else:
+            _reset_state(token)
+
+    def is_pinned(self, request, recent_write):
+        return request.method not in SAFE_METHODS or bool(recent_write)
+
+    def should_pin(self, key, state):
+        return state.wrote and key is not None and getattr(settings, 'REPLICA_PIN_SECONDS', 0)
@@ -0,0 +1,105 @@
+import re
+
+from django.db import connections
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Course
+
+SEARCH_TABLE = 'courses_course_search'
+MAX_TERMS = 10
+# Name matches count this many times more than description matches
+NAME_WEIGHT = 10.0
+
+_word = re.compile(r'\w+')
+
+
+# Full-text course search.
+#
+# Courses are searched by name and description with the database's own
+# full-text index, created by migration 0009:
+#   - SQLite: an FTS5 table (SEARCH_TABLE) whose rowid is the course id, kept in
+#     sync by the Course receivers in signals.py. rebuild_index() fills it again
+#     after changes that skip signals (bulk_create, raw SQL...),
+#   - MySQL: FULLTEXT indexes on the course table, which InnoDB keeps by itself.
+#     Words shorter than innodb_ft_min_token_size (3) and stopwords are not indexed.
+# Other databases fall back to unindexed, unranked icontains lookups.
+#
+# Every word of the query must match, the last one as a prefix too (search as you
+# type). Results are annotated with `rank`, lower is more relevant.
+
+def parse_query(text):
+    return _word.findall(text.lower())[:MAX_TERMS]
+
+
+def search_courses(queryset, text):
+    """Filter `queryset` to the courses matching `text`, annotated with `rank`."""
+    terms = parse_query(text)
+    if not terms:
+        return queryset.annotate(rank=Value(0.0)).none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        return _search_fts5(queryset, terms)
+    if vendor == 'mysql':
+        return _search_mysql(queryset, terms)
+    for term in terms:
+        queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    return queryset.annotate(rank=Value(0.0))
+
+
+def _search_fts5(queryset, terms):
+    match = ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+    course_table = Course._meta.db_table
+    # bm25() is negative, more relevant matches being lower. Ranks are rounded so
+    # they compare exactly with the ones read back from pagination cursors
+    rank = RawSQL(
+        f"SELECT ROUND(bm25({SEARCH_TABLE}, {NAME_WEIGHT}, 1.0), 6) FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {course_table}.id",
+        (match,),
+    )
+    matches = RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", (match,))
+    return queryset.filter(pk__in=matches).annotate(rank=rank)
+
+
+def _search_mysql(queryset, terms):
+    against = ' '.join([f'+{term}' for term in terms[:-1]] + [f'+{terms[-1]}*'])
+    name, description = (f"{Course._meta.db_table}.{column}" for column in ('name', 'description'))
+    relevance = RawSQL(f"MATCH ({name}, {description}) AGAINST (%s IN BOOLEAN MODE)", (against,))
+    rank = RawSQL(
+        f"-ROUND({NAME_WEIGHT} * MATCH ({name}) AGAINST (%s IN BOOLEAN MODE) "
+        f"+ MATCH ({name}, {description}) AGAINST (%s IN BOOLEAN MODE), 6)",
+        (against, against),
+    )
+    return queryset.annotate(relevance=relevance).filter(relevance__gt=0).annotate(rank=rank)
+
+
+# Index maintenance, only needed by the SQLite table
+
+def index_course(course, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [course.pk])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+            [course.pk, course.name, course.description],
+        )
+
+def unindex_course(course_id, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [course_id])
+
+def rebuild_index(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM {Course._meta.db_table}"
+        )
@@ -0,0 +1,25 @@
+from .roles import PROFESSORS, STUDENTS
+
+# Data created by the post_migrate receivers in signals.py.
+# Add entries here, existing rows are left untouched.
+
+DEFAULT_GROUPS = [PROFESSORS, STUDENTS]
+
+# (name stored in the database, display name)
+DEFAULT_CATEGORIES = [
+    ('programming', 'Programming'),
+    ('data_science', 'Data Science'),
+    ('design', 'Design'),
+    ('marketing', 'Marketing'),
+    ('business', 'Business'),
+    ('cybersecurity', 'Cybersecurity'),
+    ('cloud_computing', 'Cloud Computing'),
+    ('artificial_intelligence', 'Artificial Intelligence'),
+    ('machine_learning', 'Machine Learning'),
+    ('web_development', 'Web Development'),
+    ('mobile_app_development', 'Mobile App Development'),
+    ('game_development', 'Game Development'),
+    ('devops', 'DevOps'),
+    ('big_data', 'Big Data'),
+    ('iot', 'Internet of Things'),
+]
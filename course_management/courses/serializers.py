@@ -1,9 +1,23 @@
 from rest_framework import serializers
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from .models import *
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 
-class CategorySerializer(serializers.ModelSerializer):
+from django.db.models import Exists, OuterRef
+
+from .roles import get_group, PROFESSORS, STUDENTS
+from .instrumentation import TimedSerializerMixin
+from .relations import BulkPrimaryKeyRelatedField
+from .sparse import SparseFieldsSerializerMixin
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id','name','course_count']
+
+# Categories nested in courses, without the counter so a course payload does not
+# change with the other courses of its categories
+class CourseCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id','name']
@@ -28,28 +42,48 @@ class UserSerializer(serializers.ModelSerializer):
         user.save()
 
         # Assign the group
-        group_name = "Professors" if is_professor else "Students"
-        group, _ = Group.objects.get_or_create(name=group_name)
-        user.groups.add(group)
+        group_name = PROFESSORS if is_professor else STUDENTS
+        user.groups.add(get_group(group_name))
 
         return user
 
 class PasswordUpdateSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True, min_length=6, required=True)
 
-class CourseSerializer(serializers.ModelSerializer):
-    categories = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), many=True, write_only=True)
-    categories_details = CategorySerializer(source='categories', read_only=True, many=True)
+# Professors of a course. Same choices as the model's limit_choices_to, checked
+# against the membership table alone instead of joining the group names
+class ProfessorField(BulkPrimaryKeyRelatedField):
+    def get_queryset(self):
+        memberships = User.groups.through.objects.filter(user_id=OuterRef('pk'), group_id=get_group(PROFESSORS).pk)
+        return User.objects.filter(Exists(memberships))
+
+# Related objects rendered with ?expand= (see sparse.py)
+class UserSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username']
+
+class CourseSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Course
+        fields = ['id', 'name']
+
+class CourseSerializer(TimedSerializerMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    categories = BulkPrimaryKeyRelatedField(queryset=Category.objects.all(), many=True, write_only=True)
+    professor_id = ProfessorField()
+    categories_details = CourseCategorySerializer(source='categories', read_only=True, many=True)
 
     class Meta:
         model = Course
         fields = '__all__'
+        expandable_fields = {'professor': (UserSummarySerializer, {'source': 'professor_id'})}
 
-class StudentSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+class StudentSerializer(TimedSerializerMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    user = BulkPrimaryKeyRelatedField(queryset=User.objects.all())
     user_username = serializers.CharField(source='user.username', read_only=True)
 
     class Meta:
         model = Student
         fields = ['id', 'user', 'user_username', 'created_at']
+        expandable_fields = {'course': (CourseSummarySerializer, {})}
 
@@ -1,49 +1,284 @@
-from django.db.models.signals import post_migrate
-from django.dispatch import receiver
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver, Signal
 
 from django.contrib.auth.models import Group
 
-from .models import Category
+from .models import Category, ChangeLog, Course, Student
+from .suggestions import suggestion_index
+from .roles import role_cache, clear_groups
+from .authentication import revoke_user_tokens
+from .seed import DEFAULT_GROUPS, DEFAULT_CATEGORIES
+from . import cache, changes, counters, search
 
 from django.contrib.auth.models import User
 from django.conf import settings
 
-# Automatically create groups for users
-@receiver(post_migrate)
-def crear_grupos_por_defecto(sender, **kwargs):
-    Group.objects.get_or_create(name="Professors")
-    Group.objects.get_or_create(name="Students")
-
-# Automatically create all possible course categories
-@receiver(post_migrate)
-def create_default_categories(sender, **kwargs):
-    categories = [
-    ('programming', 'Programming'),
-    ('data_science', 'Data Science'),
-    ('design', 'Design'),
-    ('marketing', 'Marketing'),
-    ('business', 'Business'),
-    ('cybersecurity', 'Cybersecurity'),
-    ('cloud_computing', 'Cloud Computing'),
-    ('artificial_intelligence', 'Artificial Intelligence'),
-    ('machine_learning', 'Machine Learning'),
-    ('web_development', 'Web Development'),
-    ('mobile_app_development', 'Mobile App Development'),
-    ('game_development', 'Game Development'),
-    ('devops', 'DevOps'),
-    ('big_data', 'Big Data'),
-    ('iot', 'Internet of Things'),
-    ]
-    for category in categories:
-        Category.objects.get_or_create(name=category[0])
+# Sent by bulk.enroll_users() after inserting enrollments with bulk_create, which
+# skips post_save. Arguments: course, user_ids (the users that were enrolled).
+enrollments_bulk_created = Signal()
+
+# post_migrate is sent once per installed app, the seeding receivers only run for this one
+courses_app = apps.get_app_config("courses")
+
+# Automatically create groups for users.
+# Seeding uses one INSERT ... IGNORE, so re-running migrate is cheap.
+@receiver(post_migrate, sender=courses_app)
+def crear_grupos_por_defecto(sender, using, **kwargs):
+    Group.objects.using(using).bulk_create(
+        [Group(name=name) for name in DEFAULT_GROUPS], ignore_conflicts=True
+    )
+    clear_groups()
+
+# Automatically create all possible course categories. One read finds the missing
+# ones, which are inserted at once; bulk_create does not send post_save, so they
+# are logged in the change feed and the cached lists invalidated here. Re-running
+# migrate costs one query.
+@receiver(post_migrate, sender=courses_app)
+def create_default_categories(sender, using, **kwargs):
+    names = [name for name, _ in DEFAULT_CATEGORIES]
+    existing = set(Category.objects.using(using).filter(name__in=names).values_list("name", flat=True))
+    missing = [name for name in names if name not in existing]
+    if not missing:
+        return
+    Category.objects.using(using).bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+    # bulk_create does not return the ids on every database
+    changes.record_categories(Category.objects.using(using).filter(name__in=missing).order_by("id"), using)
+    transaction.on_commit(partial(cache.invalidate_list, cache.CATEGORIES), using)
 
 # Automatically create a superuser admin if it doesn't exist
-@receiver(post_migrate)
-def create_superuser(sender, **kwargs):
-    if not User.objects.filter(username=settings.SUPERUSER_USERNAME).exists():
-        User.objects.create_superuser(
+@receiver(post_migrate, sender=courses_app)
+def create_superuser(sender, using, verbosity=1, **kwargs):
+    if not settings.SUPERUSER_USERNAME:
+        return
+    if not User.objects.using(using).filter(username=settings.SUPERUSER_USERNAME).exists():
+        User.objects.db_manager(using).create_superuser(
             username=settings.SUPERUSER_USERNAME,
             email=settings.SUPERUSER_EMAIL,
             password=settings.SUPERUSER_PASSWORD
         )
-        print("SuperUser created!.")
+        if verbosity:
+            print("SuperUser created!.")
+
+# Keep the suggestions index in sync with enrollments and course categories
+@receiver(post_save, sender=Student)
+def index_enrollment(sender, instance, created, **kwargs):
+    if created:
+        suggestion_index.add_enrollment(instance.user_id, instance.course_id)
+
+@receiver(enrollments_bulk_created)
+def index_bulk_enrollments(sender, course, user_ids, **kwargs):
+    for user_id in user_ids:
+        suggestion_index.add_enrollment(user_id, course.pk)
+
+@receiver(post_delete, sender=Student)
+def unindex_enrollment(sender, instance, **kwargs):
+    suggestion_index.remove_enrollment(instance.user_id, instance.course_id)
+
+@receiver(m2m_changed, sender=Course.categories.through)
+def index_course_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # category.courses.add(...) / remove(...): instance is a Category
+        if action == "post_add":
+            for course_id in pk_set:
+                suggestion_index.add_course_categories(course_id, {instance.pk})
+        elif action == "post_remove":
+            for course_id in pk_set:
+                suggestion_index.remove_course_categories(course_id, {instance.pk})
+        elif action == "pre_clear":
+            suggestion_index.remove_category(instance.pk)
+        return
+
+    if action == "post_add":
+        suggestion_index.add_course_categories(instance.pk, pk_set)
+    elif action == "post_remove":
+        suggestion_index.remove_course_categories(instance.pk, pk_set)
+    elif action == "pre_clear":
+        suggestion_index.remove_course_categories(instance.pk)
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    suggestion_index.remove_course_categories(instance.pk)
+
+@receiver(post_delete, sender=Category)
+def unindex_category(sender, instance, **kwargs):
+    suggestion_index.remove_category(instance.pk)
+
+# Keep the enrollment and course counters in sync (see counters.py).
+# Students deleted along with their course do not update it.
+_deleting_courses = set()
+
+@receiver(post_save, sender=Student)
+def count_enrollment(sender, instance, created, **kwargs):
+    if created:
+        counters.add_enrollments(instance.course_id, 1)
+
+@receiver(enrollments_bulk_created)
+def count_bulk_enrollments(sender, course, user_ids, **kwargs):
+    counters.add_enrollments(course.pk, len(user_ids))
+
+@receiver(post_delete, sender=Student)
+def uncount_enrollment(sender, instance, **kwargs):
+    if instance.course_id not in _deleting_courses:
+        counters.add_enrollments(instance.course_id, -1)
+
+@receiver(m2m_changed, sender=Course.categories.through)
+def count_course_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # category.courses.add(...) / remove(...) / clear(): instance is a Category
+        if action in ("post_add", "post_remove", "post_clear"):
+            counters.recount_courses([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        counters.recount_courses(pk_set)
+    elif action == "pre_clear":
+        instance._cleared_category_ids = list(instance.categories.values_list("pk", flat=True))
+    elif action == "post_clear":
+        counters.recount_courses(instance.__dict__.pop("_cleared_category_ids", ()))
+
+@receiver(pre_delete, sender=Course)
+def start_course_delete(sender, instance, **kwargs):
+    _deleting_courses.add(instance.pk)
+    instance._deleted_category_ids = list(instance.categories.values_list("pk", flat=True))
+
+@receiver(post_delete, sender=Course)
+def count_deleted_course(sender, instance, **kwargs):
+    _deleting_courses.discard(instance.pk)
+    counters.recount_courses(instance.__dict__.pop("_deleted_category_ids", ()))
+
+# Keep the full-text search index in sync (see search.py)
+@receiver(post_save, sender=Course)
+def index_course_text(sender, instance, using, update_fields, **kwargs):
+    if update_fields is None or {"name", "description"} & set(update_fields):
+        search.index_course(instance, using)
+
+@receiver(post_delete, sender=Course)
+def unindex_course_text(sender, instance, using, **kwargs):
+    search.unindex_course(instance.pk, using)
+
+# Append the changes to the change log (see changes.py)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Student)
+def log_saved_object(sender, instance, created, using, **kwargs):
+    changes.record(instance, ChangeLog.CREATED if created else ChangeLog.UPDATED, using)
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Student)
+def log_deleted_object(sender, instance, using, **kwargs):
+    changes.record(instance, ChangeLog.DELETED, using)
+
+@receiver(enrollments_bulk_created)
+def log_bulk_enrollments(sender, course, user_ids, **kwargs):
+    # bulk_create does not return the ids on every database
+    changes.record_students(Student.objects.filter(course=course, user_id__in=user_ids).order_by("id"))
+
+@receiver(m2m_changed, sender=Course.categories.through)
+def log_course_categories(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == "pre_clear":
+        # The categories (or courses, reverse) removed by clear() are only known before it
+        related = instance.courses if reverse else instance.categories
+        instance._cleared_change_ids = set(related.values_list("pk", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_change_ids", set())
+    elif action not in ("post_add", "post_remove"):
+        return
+    pairs = {(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set}
+    changes.record_course_categories(pairs, ChangeLog.CREATED if action == "post_add" else ChangeLog.DELETED, using)
+
+# Drop cached roles when group memberships change, and revoke the access tokens
+# of the users involved since their role claims are stale
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+    if not reverse:
+        role_cache.invalidate(instance.pk)
+        revoke_user_tokens(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) / remove(...): pk_set holds user ids
+        role_cache.invalidate(*pk_set)
+        revoke_user_tokens(*pk_set)
+    else:
+        role_cache.clear()
+        if action == "pre_clear":
+            # group.user_set.clear(): the members are only known before the clear
+            revoke_group_members(instance)
+
+def revoke_group_members(group):
+    user_ids = list(group.user_set.values_list("id", flat=True))
+    if user_ids:
+        revoke_user_tokens(*user_ids)
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_roles(sender, instance, **kwargs):
+    role_cache.invalidate(instance.pk)
+    revoke_user_tokens(instance.pk)
+
+# Tokens carry is_staff, is_superuser and the roles, and must not outlive a password
+# change. set_password() keeps the raw password in _password until the save ends
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    password_changed = instance._password is not None or (update_fields is not None and "password" in update_fields)
+    if password_changed:
+        revoke_user_tokens(instance.pk, refresh=True)
+    elif update_fields is None or {"is_staff", "is_superuser", "is_active"} & set(update_fields):
+        revoke_user_tokens(instance.pk)
+
+# A renamed or deleted group changes the roles of all its members
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_roles(sender, **kwargs):
+    role_cache.clear()
+    clear_groups()
+
+@receiver(pre_delete, sender=Group)
+def revoke_deleted_group_tokens(sender, instance, **kwargs):
+    revoke_group_members(instance)
+
+@receiver(post_save, sender=Group)
+def revoke_renamed_group_tokens(sender, instance, created, **kwargs):
+    if not created:
+        revoke_group_members(instance)
+
+# Invalidate the cached category and course payloads. The versions are bumped
+# once the transaction commits, a payload cached before that would be read from
+# the old rows and stay cached under the new versions.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(cache.invalidate_object, cache.CATEGORIES, instance.pk), using)
+    # Courses embed their category names
+    transaction.on_commit(partial(cache.invalidate_namespace, cache.COURSES), using)
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_cached_course(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, instance.pk), using)
+
+# Courses embed their professor's username with ?expand=professor. Deleted users
+# delete their courses, which invalidates them
+@receiver(post_save, sender=User)
+def invalidate_cached_professor_courses(sender, instance, created, update_fields, using, **kwargs):
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    for course_id in Course.objects.using(using).filter(professor_id=instance.pk).values_list("id", flat=True):
+        transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, course_id), using)
+
+@receiver(m2m_changed, sender=Course.categories.through)
+def invalidate_cached_course_categories(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, instance.pk), using)
+    elif pk_set:
+        for course_id in pk_set:
+            transaction.on_commit(partial(cache.invalidate_object, cache.COURSES, course_id), using)
+    else:
+        transaction.on_commit(partial(cache.invalidate_namespace, cache.COURSES), using)
@@ -0,0 +1,176 @@
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from scipy import sparse
+
+from . import changes
+from .models import ChangeLog, Course, CourseSimilarity, SimilarityBuild, Student
+from .queries import iter_values_in_batches
+
+DEFAULT_TOP_K = 20
+# Enrollments read per query
+READ_BATCH_SIZE = 50000
+# Courses whose similarities are computed at once
+BLOCK_SIZE = 256
+
+
+# Item-to-item course similarities from co-enrollment data.
+#
+# Enrollments are read into a sparse course x user matrix (one row per course,
+# a 1 for every enrolled user). Multiplying a block of rows by the transposed
+# matrix gives how many students each course of the block shares with every
+# other course, and the cosine similarity of two courses is
+#   shared students / sqrt(students of one * students of the other).
+# The top_k most similar courses of each course, sharing at least min_common
+# students, are stored in CourseSimilarity.
+#
+# Memory is bounded by the enrollments, kept as integer arrays (16 bytes each)
+# instead of Python objects, plus one block of BLOCK_SIZE rows of the product at
+# a time; similarity rows are written block by block.
+#
+# An incremental refresh reads the enrollment changes logged since the last run
+# (see changes.py) and only recomputes the courses they can affect: the courses
+# whose students changed, the courses sharing students with them and the courses
+# that had them as neighbors. Only the enrollments of the students of those
+# courses are read. It falls back to a full build when there was no previous
+# run, when the change log was pruned past its cursor or when a deleted
+# enrollment cannot be traced back to its course.
+
+def read_enrollments(queryset):
+    """Return the (course ids, user ids) arrays of the enrollments in `queryset`."""
+    rows = iter_values_in_batches(queryset, ['course_id', 'user_id'], READ_BATCH_SIZE)
+    batches = []
+    while True:
+        batch = list(islice(rows, READ_BATCH_SIZE))
+        if not batch:
+            break
+        batches.append(np.array(batch, dtype=np.int64))
+    if not batches:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.concatenate(batches)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def top_similar(course_ids, matrix, sizes, rows, top_k, min_common):
+    """
+    Yield (course id, [(similar course id, score), ...]) for the `rows` of the
+    course x user `matrix`, whose courses have `sizes` students.
+    """
+    norms = np.sqrt(sizes)
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        shared = (matrix[block] @ transposed).tocsr()
+        for offset, row in enumerate(block):
+            begin, end = shared.indptr[offset], shared.indptr[offset + 1]
+            columns, common = shared.indices[begin:end], shared.data[begin:end]
+            keep = (columns != row) & (common >= min_common)
+            columns, common = columns[keep], common[keep]
+            scores = np.round(common / (norms[row] * norms[columns]), 6)
+            # Best score first, lower course id first among equal scores
+            order = np.lexsort((course_ids[columns], -scores))[:top_k]
+            yield int(course_ids[row]), [(int(course_ids[columns[i]]), float(scores[i])) for i in order]
+
+
+def compute(queryset, sizes_by_course, recompute, top_k, min_common):
+    """
+    Yield the similarities of the courses in the enrollments of `queryset`, only
+    the ones in `recompute` unless it is None, see top_similar().
+    """
+    course_column, user_column = read_enrollments(queryset)
+    if not len(course_column):
+        return
+    course_ids, course_index = np.unique(course_column, return_inverse=True)
+    _, user_index = np.unique(user_column, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(course_index), dtype=np.int32), (course_index, user_index)),
+        shape=(len(course_ids), int(user_index.max()) + 1),
+    )
+    # Duplicated (course, user) pairs cannot happen (unique_together), but keep it binary
+    matrix.data[:] = 1
+    sizes = np.array([sizes_by_course.get(int(course_id), 0) for course_id in course_ids], dtype=np.float64)
+    if recompute is None:
+        rows = np.arange(len(course_ids))
+    else:
+        rows = np.flatnonzero(np.isin(course_ids, np.array(sorted(recompute), dtype=np.int64)))
+    yield from top_similar(course_ids, matrix, sizes, rows, top_k, min_common)
+
+
+def course_sizes():
+    return dict(Student.objects.order_by().values('course_id').annotate(count=Count('id')).values_list('course_id', 'count'))
+
+
+def changed_courses(since):
+    """
+    Return (course ids, cursor): the courses whose enrollments changed after the
+    change log cursor `since`, None when a deleted enrollment cannot be traced.
+    """
+    courses, deleted = set(), set()
+    cursor, has_more = since, True
+    while has_more:
+        entries, cursor, has_more = changes.read_changes(cursor, changes.MAX_LIMIT, [changes.STUDENT, changes.COURSE])
+        for entry in entries:
+            if entry['model'] == changes.COURSE:
+                if entry['action'] == ChangeLog.DELETED:
+                    courses.add(entry['id'])
+            elif entry['data'] is not None:
+                courses.add(entry['data']['course'])
+            else:
+                deleted.add(entry['id'])
+
+    # Tombstones have no data, the course is in the entry that created the enrollment
+    traced = ChangeLog.objects.filter(model=changes.STUDENT, object_id__in=deleted, action=ChangeLog.CREATED)
+    traced = dict(traced.values_list('object_id', 'data'))
+    if deleted - traced.keys():
+        return None, cursor
+    courses.update(data['course'] for data in traced.values())
+    return courses, cursor
+
+
+def build_similarities(top_k=DEFAULT_TOP_K, min_common=1, incremental=False):
+    """
+    Compute and store the course similarities, every course or, when
+    `incremental`, the ones affected by the enrollment changes since the last
+    build. Returns the SimilarityBuild of the run.
+    """
+    last = SimilarityBuild.objects.order_by('-id').first() if incremental else None
+    affected = None
+    if last is not None and not changes.is_expired(last.cursor):
+        affected, cursor = changed_courses(last.cursor)
+    if affected is None:
+        cursor = changes.latest_cursor()
+        return _store(Student.objects.all(), None, top_k, min_common, cursor)
+
+    users = Student.objects.filter(course_id__in=affected).values('user_id')
+    recompute = set(affected)
+    recompute.update(Student.objects.filter(user_id__in=users).values_list('course_id', flat=True).distinct())
+    recompute.update(CourseSimilarity.objects.filter(similar_course_id__in=affected).values_list('course_id', flat=True))
+    users = Student.objects.filter(course_id__in=recompute).values('user_id')
+    return _store(Student.objects.filter(user_id__in=users), recompute, top_k, min_common, cursor)
+
+
+def _store(queryset, recompute, top_k, min_common, cursor):
+    with transaction.atomic():
+        stale = CourseSimilarity.objects.all()
+        if recompute is not None:
+            stale = stale.filter(course_id__in=recompute)
+        stale.delete()
+
+        existing = set(Course.objects.values_list('id', flat=True))
+        batch = []
+        for course_id, similar in compute(queryset, course_sizes(), recompute, top_k, min_common):
+            # Skip courses deleted while reading
+            batch.extend(
+                CourseSimilarity(course_id=course_id, similar_course_id=similar_id, score=score)
+                for similar_id, score in similar
+                if course_id in existing and similar_id in existing
+            )
+            if len(batch) >= READ_BATCH_SIZE:
+                CourseSimilarity.objects.bulk_create(batch)
+                batch = []
+        CourseSimilarity.objects.bulk_create(batch)
+
+        courses = len(existing) if recompute is None else len(recompute)
+        return SimilarityBuild.objects.create(cursor=cursor, incremental=recompute is not None, courses=courses)
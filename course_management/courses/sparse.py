@@ -0,0 +1,73 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .fast_serializers import get_values_serializer
+
+
+# Sparse fieldsets and expansions.
+#
+# Reads accept two comma separated query parameters:
+#   ?fields=id,name    only these fields are rendered,
+#   ?expand=professor  these related objects are rendered too, nested.
+# Serializers list their expansions in Meta.expandable_fields as
+# {name: (serializer class, kwargs)}. Since optimize_for_serializer() and the
+# ValuesSerializer read the fields of the serializer, fields left out are not
+# selected and relations left out are not joined or prefetched.
+
+def parse_field_list(request, name):
+    """Return the names in the `name` query parameter as a frozenset, None when absent."""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return frozenset(part.strip() for part in value.split(',') if part.strip())
+
+
+class SparseFieldsSerializerMixin:
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.requested_fields = fields
+        self.expand = expand or frozenset()
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        unknown = self.expand - expandable.keys()
+        if unknown:
+            raise ValidationError({'expand': f"Unknown expansions: {', '.join(sorted(unknown))}."})
+        for name in sorted(self.expand):
+            serializer_class, kwargs = expandable[name]
+            fields[name] = serializer_class(read_only=True, **kwargs)
+
+        if self.requested_fields is None:
+            return fields
+        readable = {name for name, field in fields.items() if not field.write_only}
+        unknown = self.requested_fields - readable
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+        # Expanded relations are always rendered
+        return {
+            name: field for name, field in fields.items()
+            if field.write_only or name in self.requested_fields or name in self.expand
+        }
+
+
+# View mixin passing ?fields= and ?expand= to the serializers of reads. Writes
+# always answer with the full representation.
+class SparseFieldsMixin:
+    def get_sparse_kwargs(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return {}
+        kwargs = {}
+        for name in ('fields', 'expand'):
+            value = parse_field_list(request, name)
+            if value is not None:
+                kwargs[name] = value
+        return kwargs
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.get_sparse_kwargs(), **kwargs)
+
+    def get_values_serializer(self):
+        return get_values_serializer(self.get_serializer_class(), **self.get_sparse_kwargs())
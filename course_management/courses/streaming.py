@@ -0,0 +1,62 @@
+import csv
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def iter_json_array(rows):
+    """
+    Encode an iterable of dicts as a JSON array, one chunk per row, so the whole
+    list never has to be held in memory.
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    yield '['
+    first = True
+    for row in rows:
+        if not first:
+            yield ','
+        yield encoder.encode(row)
+        first = False
+    yield ']'
+
+
+def iter_ndjson(rows):
+    """Encode an iterable of dicts as newline delimited JSON, one line per row."""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+# csv.writer only needs an object with write(), returning the line lets the
+# generator below yield it instead of buffering it
+class _Echo:
+    def write(self, value):
+        return value
+
+def iter_csv(rows, header):
+    """Encode an iterable of tuples as CSV lines, starting with the header."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def streaming_json_response(rows, status=200):
+    return StreamingHttpResponse(iter_json_array(rows), status=status, content_type='application/json')
+
+
+def streaming_export_response(rows, header, export_format, filename):
+    """
+    Stream `rows` (tuples in `header` order) as NDJSON or CSV, as an attachment
+    named `filename` with the format's extension.
+    """
+    if export_format == 'csv':
+        content = iter_csv(rows, header)
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content = iter_ndjson(dict(zip(header, row)) for row in rows)
+        content_type = 'application/x-ndjson; charset=utf-8'
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,282 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from rest_framework.exceptions import ValidationError
+
+from .models import Course, CourseSimilarity, Student
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+# In-memory index used by the suggestions endpoint.
+#
+# It keeps three maps that are enough to answer "which courses share categories
+# with the ones this user is enrolled in" without touching the database:
+#   - user_courses:      user id     -> set of course ids the user is enrolled in
+#   - course_categories: course id   -> set of category ids of the course
+#   - category_courses:  category id -> set of course ids (postings list)
+#
+# The index is built lazily on first use and kept up to date by the signals in
+# signals.py. Every worker process has its own copy, so it is also rebuilt after
+# SUGGESTIONS_INDEX_TTL seconds to pick up changes made by other processes.
+#
+# A build reads the tables without holding the lock, so the updates that arrive
+# meanwhile are queued in _pending and replayed on the new maps when they are
+# swapped in. Every update sets or clears one membership, so replaying one the
+# build already saw changes nothing. Only one thread builds at a time: the others
+# wait for it on the first build and keep answering from the current maps when
+# it is only a refresh.
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built_at = None
+        self._pending = None
+        self.user_courses = defaultdict(set)
+        self.course_categories = defaultdict(set)
+        self.category_courses = defaultdict(set)
+
+    def _ttl(self):
+        return getattr(settings, 'SUGGESTIONS_INDEX_TTL', 300)
+
+    def is_stale(self):
+        if self._built_at is None:
+            return True
+        ttl = self._ttl()
+        return ttl is not None and time.monotonic() - self._built_at > ttl
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        with self._lock:
+            self._pending = []
+        try:
+            user_courses = defaultdict(set)
+            course_categories = defaultdict(set)
+            category_courses = defaultdict(set)
+
+            for user_id, course_id in Student.objects.values_list('user_id', 'course_id').iterator(chunk_size=5000):
+                user_courses[user_id].add(course_id)
+
+            through = Course.categories.through.objects.values_list('course_id', 'category_id')
+            for course_id, category_id in through.iterator(chunk_size=5000):
+                course_categories[course_id].add(category_id)
+                category_courses[category_id].add(course_id)
+
+            with self._lock:
+                self.user_courses = user_courses
+                self.course_categories = course_categories
+                self.category_courses = category_courses
+                for update, args in self._pending:
+                    update(*args)
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def ensure_built(self):
+        if not self.is_stale():
+            return
+        # A stale index still answers while another thread refreshes it
+        if not self._build_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            if self.is_stale():
+                self._build()
+        finally:
+            self._build_lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    # Incremental updates, called from signals. Until the index has been built
+    # they are only queued for the running build, if any, since the first build
+    # reads everything anyway.
+
+    def _update(self, update, *args):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((update, args))
+            if self._built_at is not None:
+                update(*args)
+
+    def add_enrollment(self, user_id, course_id):
+        self._update(self._add_enrollment, user_id, course_id)
+
+    def remove_enrollment(self, user_id, course_id):
+        self._update(self._remove_enrollment, user_id, course_id)
+
+    def add_course_categories(self, course_id, category_ids):
+        self._update(self._add_course_categories, course_id, set(category_ids))
+
+    def remove_course_categories(self, course_id, category_ids=None):
+        if category_ids is not None:
+            category_ids = set(category_ids)
+        self._update(self._remove_course_categories, course_id, category_ids)
+
+    def remove_category(self, category_id):
+        self._update(self._remove_category, category_id)
+
+    def _add_enrollment(self, user_id, course_id):
+        self.user_courses[user_id].add(course_id)
+
+    def _remove_enrollment(self, user_id, course_id):
+        courses = self.user_courses.get(user_id)
+        if courses is not None:
+            courses.discard(course_id)
+            if not courses:
+                del self.user_courses[user_id]
+
+    def _add_course_categories(self, course_id, category_ids):
+        self.course_categories[course_id].update(category_ids)
+        for category_id in category_ids:
+            self.category_courses[category_id].add(course_id)
+
+    def _remove_course_categories(self, course_id, category_ids):
+        current = self.course_categories.get(course_id, set())
+        if category_ids is None:
+            category_ids = set(current)
+        for category_id in category_ids:
+            current.discard(category_id)
+            postings = self.category_courses.get(category_id)
+            if postings is not None:
+                postings.discard(course_id)
+                if not postings:
+                    del self.category_courses[category_id]
+        if not current:
+            self.course_categories.pop(course_id, None)
+
+    def _remove_category(self, category_id):
+        for course_id in self.category_courses.pop(category_id, set()):
+            categories = self.course_categories.get(course_id)
+            if categories is not None:
+                categories.discard(category_id)
+
+    # Queries
+
+    # Pass build=False from async code, after building the index with sync_to_async
+
+    def enrolled_courses(self, user_id, build=True):
+        if build:
+            self.ensure_built()
+        with self._lock:
+            return set(self.user_courses.get(user_id, ()))
+
+    def rank(self, user_id, build=True):
+        """
+        Return [(course_id, overlap), ...] for the courses sharing at least one
+        category with the user's courses, best overlap first.
+        """
+        if build:
+            self.ensure_built()
+        with self._lock:
+            enrolled = set(self.user_courses.get(user_id, ()))
+            categories = set()
+            for course_id in enrolled:
+                categories |= self.course_categories.get(course_id, set())
+
+            overlap = Counter()
+            for category_id in categories:
+                overlap.update(self.category_courses.get(category_id, ()))
+
+        for course_id in enrolled:
+            overlap.pop(course_id, None)
+
+        return sorted(overlap.items(), key=lambda item: (-item[1], item[0]))
+
+
+suggestion_index = SuggestionIndex()
+
+
+def parse_page_params(query_params):
+    """Read ?limit= and ?offset= from the query string."""
+    try:
+        limit = int(query_params.get('limit', DEFAULT_LIMIT))
+        offset = int(query_params.get('offset', 0))
+    except ValueError:
+        raise ValidationError({"detail": "limit and offset must be integers."})
+    if limit < 1 or offset < 0:
+        raise ValidationError({"detail": "limit must be positive and offset cannot be negative."})
+    return min(limit, MAX_LIMIT), offset
+
+
+def _neighbors_queryset(enrolled):
+    # One read of the (course, similar_course) unique index
+    return CourseSimilarity.objects.filter(course_id__in=enrolled).values_list('similar_course_id', 'score')
+
+def merge_neighbors(neighbors, ranked, enrolled):
+    """
+    Merge `neighbors`, the (course id, score) rows of CourseSimilarity for the
+    user's `enrolled` courses, with the category `ranked` courses: courses taken
+    by the students of the user's courses come first, by summed similarity, then
+    the other courses sharing categories.
+    """
+    scores = defaultdict(float)
+    for course_id, score in neighbors:
+        if course_id not in enrolled:
+            scores[course_id] += score
+    merged = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    merged.extend(item for item in ranked if item[0] not in scores)
+    return merged
+
+
+def _page_queryset(page):
+    course_ids = [course_id for course_id, _ in page]
+    return Course.objects.filter(id__in=course_ids).only('id', 'name', 'description').prefetch_related('categories')
+
+def _format_page(page, courses):
+    courses_by_id = {course.id: course for course in courses}
+    suggested = []
+    for course_id, _ in page:
+        course = courses_by_id.get(course_id)
+        if course is None:
+            continue
+        suggested.append({
+            "name": course.name,
+            "description": course.description,
+            "categories": [category.name for category in course.categories.all()],
+        })
+    return suggested
+
+
+def get_suggestions(user_id, limit, offset=0):
+    """
+    Return (total, courses) where courses is the requested page of suggested
+    courses as dicts with their name, description and category names.
+    """
+    enrolled = suggestion_index.enrolled_courses(user_id)
+    neighbors = _neighbors_queryset(enrolled) if enrolled else []
+    ranked = merge_neighbors(neighbors, suggestion_index.rank(user_id), enrolled)
+    page = ranked[offset:offset + limit]
+    if not page:
+        return len(ranked), []
+    return len(ranked), _format_page(page, _page_queryset(page))
+
+
+async def aensure_index_built():
+    if suggestion_index.is_stale():
+        await sync_to_async(suggestion_index.ensure_built)()
+
+
+async def aget_suggestions(user_id, limit, offset=0):
+    """
+    get_suggestions() for async views. Only building the index needs the sync ORM,
+    which happens once per SUGGESTIONS_INDEX_TTL.
+    """
+    await aensure_index_built()
+    enrolled = suggestion_index.enrolled_courses(user_id, build=False)
+    neighbors = [row async for row in _neighbors_queryset(enrolled)] if enrolled else []
+    ranked = merge_neighbors(neighbors, suggestion_index.rank(user_id, build=False), enrolled)
+    page = ranked[offset:offset + limit]
+    if not page:
+        return len(ranked), []
+    courses = [course async for course in _page_queryset(page).aiterator(chunk_size=limit)]
+    return len(ranked), _format_page(page, courses)
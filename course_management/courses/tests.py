@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import csv
+import tempfile
+import io
+import threading
+import time
+import json
+import uuid
+from urllib.parse import urlsplit
+from datetime import date
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.db.models.functions import Now
+from django.db.models.signals import post_migrate
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils import timezone
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import benchmark, bulk, changes, renderers, signals
+from .authentication import ClaimsTokenObtainPairSerializer, get_auth_cache
+from .bulk import import_users
+from .cache import get_cache
+from .changes import prune_changes
+from .checks import check_auth_cache, check_replica_pin_cache
+from .fast_serializers import get_values_serializer
+from .instrumentation import InstrumentationMiddleware, registry
+from .mixins import QueryBudgetExceeded
+from .models import Category, ChangeLog, ChangeLogPrune, Course, CourseSimilarity, Student
+from .permissions import IsProfessor, IsProfessorOrReadOnly
+from .renderers import FastJSONRenderer
+from .roles import get_user_roles, role_cache
+from .routers import ReplicaPinningMiddleware, get_pin_cache, replica_health
+from .seed import DEFAULT_CATEGORIES
+from .similarity import build_similarities
+from .serializers import CategorySerializer, CourseSerializer, StudentSerializer
+from .suggestions import SuggestionIndex, suggestion_index
+from .views import StudentExportView
+
+
+# Token claims are only trusted with a cache shared by the workers (see authentication.py)
+SHARED_AUTH_CACHE = {
+    **settings.CACHES,
+    "auth": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": tempfile.mkdtemp()},
+}
+
+
+@override_settings(CACHES=SHARED_AUTH_CACHE, AUTH_CACHE_ALIAS="auth")
+class APITestCase(TestCase):
+    def setUp(self):
+        suggestion_index.invalidate()
+        get_cache().clear()
+        self.professor = User.objects.create_user(username="professor", password="professor")
+        self.professor.groups.add(Group.objects.get(name="Professors"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.professor)
+
+    def create_course(self, name="Course", categories=(), description="Description"):
+        course = Course.objects.create(
+            name=name,
+            description=description,
+            professor_id=self.professor,
+            start_date=date(2025, 9, 1),
+            end_date=date(2026, 6, 30),
+        )
+        course.categories.set(categories)
+        return course
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class CourseQueryBudgetTests(APITestCase):
+    def test_course_list_query_count_does_not_grow_with_rows(self):
+        categories = list(Category.objects.all()[:3])
+        self.create_course(categories=categories)
+        with self.assertNumQueries(2):
+            self.client.get("/api/courses/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(20):
+                self.create_course(name=f"Course {i}", categories=categories)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/courses/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_retrieve_within_budget(self):
+        course = self.create_course(categories=Category.objects.all()[:2])
+        response = self.client.get(f"/api/courses/{course.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["categories_details"]), 2)
+
+    def test_student_list_does_not_query_each_user(self):
+        course = self.create_course()
+        for i in range(10):
+            Student.objects.create(user=User.objects.create(username=f"student{i}"), course=course)
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/courses/{course.id}/students/")
+        self.assertEqual(response.data["results"][0]["user_username"], "student0")
+
+    def test_user_list_does_not_query_each_user(self):
+        students = Group.objects.get(name="Students")
+        for i in range(10):
+            User.objects.create(username=f"student{i}").groups.add(students)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/users/")
+        self.assertEqual(len(response.data["results"]), User.objects.count())
+        self.assertEqual(sum(user["professor"] for user in response.data["results"]), 1)
+        # The groups of the page are prefetched at once
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/users/", {"expand": "groups"})
+        self.assertEqual(response.data["results"][-1]["groups"], ["Students"])
+
+    @override_settings(QUERY_BUDGET_DEFAULT=0)
+    def test_over_budget_raises_in_tests(self):
+        course = self.create_course()
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.delete(f"/api/courses/{course.id}/")
+
+
+class KeysetPaginationTests(APITestCase):
+    def test_walks_pages_forward_and_back_by_date(self):
+        for i in range(5):
+            course = self.create_course(name=f"Course {i}")
+            Course.objects.filter(pk=course.pk).update(start_date=date(2025, 9, 1 + i % 2))
+
+        response = self.client.get("/api/courses/?ordering=-start_date&page_size=2")
+        seen = [course["id"] for course in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [course["id"] for course in response.data["results"]]
+
+        expected = list(Course.objects.order_by("-start_date", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+        previous = self.client.get(response.data["previous"])
+        self.assertEqual([course["id"] for course in previous.data["results"]], expected[2:4])
+
+    def test_rejects_unknown_ordering_and_filters_by_category(self):
+        categories = list(Category.objects.all()[:2])
+        in_category = self.create_course(categories=categories)
+        self.create_course()
+
+        response = self.client.get("/api/courses/?ordering=description")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(f"/api/courses/?category={categories[0].id},{categories[1].id}")
+        self.assertEqual([course["id"] for course in response.data["results"]], [in_category.id])
+
+
+class CachedReadTests(APITestCase):
+    def test_second_read_skips_database_and_honours_etag(self):
+        course = self.create_course(categories=Category.objects.all()[:1])
+        first = self.client.get(f"/api/courses/{course.id}/")
+
+        with self.assertNumQueries(0):
+            second = self.client.get(f"/api/courses/{course.id}/")
+        self.assertEqual(second.data, first.data)
+
+        not_modified = self.client.get(f"/api/courses/{course.id}/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_changes_invalidate_cached_payloads(self):
+        category = Category.objects.first()
+        course = self.create_course(categories=[category])
+        self.client.get("/api/courses/")
+        self.client.get(f"/api/courses/{course.id}/")
+
+        category.name = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        response = self.client.get(f"/api/courses/{course.id}/")
+        self.assertEqual(response.data["categories_details"][0]["name"], "renamed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course.categories.clear()
+        response = self.client.get("/api/courses/")
+        self.assertEqual(response.data["results"][0]["categories_details"], [])
+
+    def test_invalidated_on_commit(self):
+        course = self.create_course()
+        self.client.get(f"/api/courses/{course.id}/")
+        with self.captureOnCommitCallbacks() as callbacks:
+            course.name = "renamed"
+            course.save()
+            Student.objects.create(user=User.objects.create(username="student"), course=course)
+            # Until the commit, a read could still cache the old rows under the current versions
+            with self.assertNumQueries(0):
+                self.client.get(f"/api/courses/{course.id}/")
+        for callback in callbacks:
+            callback()
+        response = self.client.get(f"/api/courses/{course.id}/")
+        self.assertEqual((response.data["name"], response.data["enrollment_count"]), ("renamed", 1))
+
+
+class FastSerializerTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        categories = list(Category.objects.all()[:3])
+        Category.objects.filter(id=categories[2].id).update(name="diseño \u2028 ✓")
+        self.create_course(name="Curso de programación", categories=categories)
+        self.create_course(name='Quotes "and" \\ backslashes')
+        course = self.create_course(name="Line\u2029separator", categories=categories[:1])
+        for i, microsecond in enumerate([0, 1, 999999]):
+            user = User.objects.create(username=f"ñandú{i}")
+            student = Student.objects.create(user=user, course=course)
+            Student.objects.filter(id=student.id).update(created_at=student.created_at.replace(microsecond=microsecond))
+
+    def assertSameBytes(self, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        values_serializer = get_values_serializer(serializer_class)
+        rows = list(values_serializer.values(queryset))
+        with self.assertNumQueries(1 if values_serializer.nested else 0):
+            data = values_serializer.to_representation(rows)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_values_serializers_render_the_same_bytes(self):
+        self.assertSameBytes(CourseSerializer, Course.objects.order_by("id"))
+        self.assertSameBytes(StudentSerializer, Student.objects.order_by("id"))
+        self.assertSameBytes(CategorySerializer, Category.objects.order_by("id"))
+
+    def test_list_endpoints_match_serializer_output(self):
+        response = self.client.get("/api/courses/")
+        expected = CourseSerializer(Course.objects.order_by("id"), many=True).data
+        self.assertEqual(response.json()["results"], json.loads(JSONRenderer().render(expected)))
+
+    def test_renderer_uses_orjson(self):
+        # Pinned in requirements.txt, the comparisons below would otherwise test JSONRenderer against itself
+        with patch.object(renderers.orjson, "dumps", wraps=renderers.orjson.dumps) as dumps:
+            FastJSONRenderer().render({"a": 1})
+        dumps.assert_called_once()
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "text": "ünïcode \u2028 \u2029 \"quoted\"",
+            "numbers": [1, -2, 3.5, 10 ** 30, Decimal("1.10")],
+            "dates": [date(2025, 9, 1), timezone.now(), timezone.now().replace(microsecond=0)],
+            "uuid": uuid.UUID(int=1),
+            "error": ErrorDetail("Not found.", code="not_found"),
+            1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+
+class StatelessAuthTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Forget the revocation made when the professor joined its group
+        get_auth_cache().clear()
+        self.client = APIClient()
+
+    def issue_tokens(self, user, age=0):
+        # `age` seconds old tokens, revocations have a resolution of one second
+        refresh = ClaimsTokenObtainPairSerializer.get_token(user)
+        access = refresh.access_token
+        access["iat"] -= age
+        refresh["iat"] -= age
+        return str(access), str(refresh)
+
+    def test_obtained_token_carries_claims(self):
+        response = self.client.post("/api/token/", {"username": "professor", "password": "professor"})
+        access = AccessToken(response.data["access"])
+        self.assertEqual(access["roles"], ["Professors"])
+        self.assertIs(access["is_staff"], False)
+
+    def test_authenticated_requests_do_not_query_the_user(self):
+        access, _ = self.issue_tokens(self.professor)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as queries:
+            read = self.client.get("/api/categories/")
+            # Needs the Professors role, fails validation
+            write = self.client.post("/api/courses/", {})
+        self.assertEqual((read.status_code, write.status_code), (200, 400))
+        self.assertEqual([query["sql"] for query in queries if "auth_" in query["sql"]], [])
+
+    def test_role_change_revokes_access_and_refresh_reissues_claims(self):
+        access, refresh = self.issue_tokens(self.professor, age=5)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(self.client.get("/api/categories/").status_code, 200)
+
+        self.professor.groups.add(Group.objects.get(name="Students"))
+        self.assertEqual(self.client.get("/api/categories/").status_code, 401)
+
+        response = self.client.post("/api/token/refresh/", {"refresh": refresh})
+        self.assertEqual(AccessToken(response.data["access"])["roles"], ["Professors", "Students"])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get("/api/categories/").status_code, 200)
+
+    def test_password_change_ends_refresh_tokens(self):
+        _, refresh = self.issue_tokens(self.professor, age=5)
+        self.professor.set_password("changed")
+        self.professor.save()
+        self.assertEqual(self.client.post("/api/token/refresh/", {"refresh": refresh}).status_code, 401)
+
+        # Tokens obtained with the new password work
+        response = self.client.post("/api/token/", {"username": "professor", "password": "changed"})
+        self.assertEqual(self.client.post("/api/token/refresh/", {"refresh": response.data["refresh"]}).status_code, 200)
+
+    def test_api_routes_ignore_sessions(self):
+        self.client.force_login(self.professor)
+        self.assertEqual(self.client.get("/api/categories/").status_code, 401)
+        self.assertEqual(self.client.get("/swagger/?format=openapi").status_code, 200)
+
+    @override_settings(AUTH_CACHE_ALIAS="default")
+    def test_process_local_cache_loads_the_user(self):
+        access, _ = self.issue_tokens(self.professor)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/api/categories/").status_code, 200)
+        self.assertTrue(any("auth_user" in query["sql"] for query in queries))
+
+        User.objects.filter(id=self.professor.id).update(is_active=False)
+        self.assertEqual(self.client.get("/api/categories/").status_code, 401)
+        self.assertEqual([error.id for error in check_auth_cache(None)], ["courses.W001"])
+
+    def test_revoke_endpoint_denylists_both_tokens(self):
+        access, refresh = self.issue_tokens(self.professor)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.post("/api/token/revoke/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get("/api/categories/").status_code, 401)
+        self.client.credentials()
+        response = self.client.post("/api/token/refresh/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 401)
+
+
+class RosterExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.other_course = self.create_course(name="Other")
+        users = User.objects.bulk_create([User(username=f"student{i}") for i in range(5)])
+        for user in users:
+            Student.objects.create(user=user, course=self.course)
+        Student.objects.create(user=users[0], course=self.other_course)
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_export_matches_student_list(self):
+        response = self.client.get(f"/api/courses/{self.course.id}/students/export/")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        listed = self.client.get(f"/api/courses/{self.course.id}/students/").json()["results"]
+        self.assertEqual(rows, listed)
+
+    def test_csv_export_is_read_in_batches(self):
+        with patch.object(StudentExportView, "batch_size", 2), self.assertNumQueries(4):
+            # course lookup + batches of 2, 2 and 1 rows
+            response = self.client.get(f"/api/courses/{self.course.id}/students/export/?format=csv")
+            content = self.read(response)
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ["id", "user", "user_username", "created_at"])
+        self.assertEqual([row[2] for row in rows[1:]], [f"student{i}" for i in range(5)])
+
+    def test_full_export_requires_administrator(self):
+        self.assertEqual(self.client.get("/api/students/export/").status_code, 403)
+        self.professor.is_staff = True
+        self.professor.save()
+        response = self.client.get("/api/students/export/?format=csv")
+        rows = list(csv.reader(io.StringIO(self.read(response))))
+        self.assertEqual(rows[0], ["id", "course", "user", "user_username", "created_at"])
+        self.assertEqual(len(rows), 7)
+
+    def test_unknown_course_is_not_found(self):
+        response = self.client.get("/api/courses/999/students/export/")
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewsTests(APITestCase):
+    async def test_async_endpoints_match_sync_payloads(self):
+        categories = [category async for category in Category.objects.all()[:3]]
+        course = await sync_to_async(self.create_course)(name="a", categories=categories[:2])
+        await sync_to_async(self.create_course)(name="b", categories=categories[1:])
+        await Student.objects.acreate(user=self.professor, course=course)
+
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.professor)}"}
+        for path in [
+            f"/courses/?category={categories[0].id}",
+            f"/courses/{course.id}/",
+            f"/courses/{course.id}/students/",
+            f"/categories/{categories[0].id}/",
+            f"/users/{self.professor.id}/suggestions/",
+        ]:
+            expected = await sync_to_async(self.client.get)(f"/api{path}")
+            response = await AsyncClient().get(f"/api/async{path}", headers=headers)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.content, expected.content, path)
+
+    async def test_async_endpoints_require_a_valid_token(self):
+        response = await AsyncClient().get("/api/async/categories/")
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get("/api/async/courses/999/")
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor in ("sqlite", "mysql"), "EXPLAIN output is only checked on SQLite and MySQL")
+class IndexUsageTests(APITestCase):
+    """
+    Run EXPLAIN on the SQL actually sent by the main list endpoints and check
+    that it goes through the expected index.
+    """
+
+    def explain(self, url, table):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = next(
+            query["sql"] for query in queries
+            if query["sql"].startswith("SELECT")
+            and f"FROM {table}" in query["sql"].replace("`", "").replace('"', "")
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            else:
+                cursor.execute(f"EXPLAIN {sql}")
+            return " ".join(str(value) for row in cursor.fetchall() for value in row)
+
+    def test_course_list_uses_date_indexes(self):
+        self.create_course()
+        self.assertIn("course_start_date_idx", self.explain("/api/courses/?ordering=start_date", "courses_course"))
+        self.assertIn("course_end_date_idx", self.explain("/api/courses/?ordering=-end_date", "courses_course"))
+
+    def test_course_list_by_professor_uses_professor_index(self):
+        self.create_course()
+        plan = self.explain(f"/api/courses/?professor={self.professor.id}&ordering=start_date", "courses_course")
+        self.assertIn("course_professor_start_idx", plan)
+
+    def test_student_list_uses_course_created_index(self):
+        course = self.create_course()
+        Student.objects.create(user=self.professor, course=course)
+        plan = self.explain(f"/api/courses/{course.id}/students/?ordering=created_at", "courses_student")
+        self.assertIn("student_course_created_idx", plan)
+
+
+class BulkEnrollmentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course()
+        self.users = User.objects.bulk_create([User(username=f"student{i}") for i in range(3)])
+
+    def enroll(self, users, **kwargs):
+        response = self.client.post(f"/api/courses/{self.course.id}/students/bulk/", {"users": users}, format="json", **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return [(result["user"], result["status"]) for result in response.data["results"]]
+
+    def test_only_integral_ids_are_accepted(self):
+        user = self.users[0]
+        values = [True, user.id + 0.5, 10 ** 30, "abc", -1]
+        self.assertEqual(self.enroll(values), [(value, "invalid") for value in values])
+        self.assertEqual(self.enroll([float(user.id), str(user.id)]), [(user.id, "created"), (user.id, "duplicate")])
+
+    def test_statuses(self):
+        first, second, third = self.users
+        Student.objects.create(user=first, course=self.course)
+        self.assertEqual(self.enroll([first.id, second.id, second.id, 999999, "x"]), [
+            (first.id, "already_enrolled"), (second.id, "created"), (second.id, "duplicate"),
+            (999999, "user_not_found"), ("x", "invalid"),
+        ])
+        # CSV: first column, with a header row
+        response = self.client.post(
+            f"/api/courses/{self.course.id}/students/bulk/", f"user\n{third.id}\n{first.id}\n".encode(), content_type="text/csv",
+        )
+        self.assertEqual(response.data["summary"], {"created": 1, "already_enrolled": 1})
+
+    def test_rejects_bodies_that_are_not_lists_of_ids(self):
+        for body in [5, str(self.users[0].id), {"users": 5}]:
+            response = self.client.post(f"/api/courses/{self.course.id}/students/bulk/", body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(Student.objects.exists())
+
+    def test_concurrent_enrollments_are_not_counted_twice(self):
+        first, second, third = self.users
+        real_insert = bulk._insert_enrollments
+
+        def insert_after_concurrent_request(course, user_ids):
+            # Another request enrolls the first user between the check and the insert
+            Student.objects.create(user=first, course=course)
+            return real_insert(course, user_ids)
+
+        with patch("courses.bulk._insert_enrollments", insert_after_concurrent_request):
+            results = self.enroll([first.id, second.id, third.id])
+        self.assertEqual(results, [(first.id, "already_enrolled"), (second.id, "created"), (third.id, "created")])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrollment_count, 3)
+
+
+@override_settings(SERVER_TIMING=True, N_PLUS_ONE_THRESHOLD=5, METRICS_TOKEN="scraper")
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_server_timing_reports_queries_and_phases(self):
+        self.create_course()
+        response = self.client.get("/api/courses/")
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('"2 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+
+    def test_metrics_are_aggregated_by_view(self):
+        self.client.get("/api/courses/")
+        self.client.get("/api/courses/")
+        metrics = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scraper").content.decode()
+        self.assertIn('api_requests_total{view="CourseViewSet.list",method="GET",status="200"} 2', metrics)
+        # The second read is served from the cache
+        self.assertIn('api_db_queries_total{view="CourseViewSet.list"} 1', metrics)
+
+        # Local requests need the token too, a reverse proxy makes every request local
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 404)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code, 404)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 404)
+
+    def test_repeated_queries_are_flagged(self):
+        courses = [self.create_course(name=f"Course {i}") for i in range(5)]
+
+        def view(request):
+            for course in courses:
+                list(Course.objects.filter(pk=course.pk))
+            return HttpResponse()
+
+        with self.assertLogs("courses.instrumentation", "WARNING"):
+            response = InstrumentationMiddleware(view)(RequestFactory().get("/"))
+        self.assertIn("n-plus-one", response["Server-Timing"])
+        self.assertIn('api_n_plus_one_total{view="<unresolved>"} 1', registry.render())
+
+
+# Not a TestCase: reads inside its transaction always go to the primary
+@override_settings(REPLICA_DATABASES=["replica"], REPLICA_PIN_SECONDS=5, REPLICA_MAX_LAG=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        replica_health.clear()
+        get_pin_cache().clear()
+        self.factory = RequestFactory()
+        self.reads = []
+
+    def handle(self, method, write=False, token="a"):
+        def view(request):
+            self.reads.append(router.db_for_read(Course))
+            if write:
+                router.db_for_write(Course)
+                self.reads.append(router.db_for_read(Course))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        ReplicaPinningMiddleware(view)(request)
+
+    @patch("courses.routers.replica_lag", return_value=0)
+    def test_safe_methods_read_from_replicas_until_a_write(self, lag):
+        self.handle("get", write=True)
+        self.handle("post")
+        self.assertEqual(self.reads, ["replica", "default", "default"])
+        # Outside requests everything stays on the primary
+        self.assertEqual(router.db_for_read(Course), "default")
+
+    @patch("courses.routers.replica_lag", return_value=0)
+    def test_client_is_pinned_to_primary_after_writing(self, lag):
+        self.handle("post", write=True, token="writer")
+        self.handle("get", token="writer")
+        self.handle("get", token="other")
+        self.assertEqual(self.reads[-2:], ["default", "replica"])
+
+    @patch("courses.routers.replica_lag", return_value=30)
+    def test_lagging_replica_falls_back_to_primary(self, lag):
+        with self.assertLogs("courses.routers", "WARNING"):
+            self.handle("get")
+        self.handle("get")
+        self.assertEqual(self.reads, ["default", "default"])
+        # Checked once per REPLICA_LAG_CHECK_INTERVAL
+        self.assertEqual(lag.call_count, 1)
+
+    @patch("courses.routers.replica_lag", return_value=0)
+    def test_streamed_bodies_are_routed_until_closed(self, lag):
+        def stream(request):
+            def rows():
+                self.reads.append(router.db_for_read(Course))
+                yield "[]"
+            return StreamingHttpResponse(rows())
+
+        def get(token):
+            request = self.factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+            response = ReplicaPinningMiddleware(stream)(request)
+            b"".join(response.streaming_content)
+            response.close()
+
+        self.handle("post", write=True, token="writer")
+        get("writer")
+        get("other")
+        self.assertEqual(self.reads[-2:], ["default", "replica"])
+        # Closing the response ends the request's routing
+        self.assertEqual(router.db_for_read(Course), "default")
+
+    @patch("courses.routers.replica_lag", return_value=0)
+    def test_async_requests_check_replicas_in_the_calling_thread(self, lag):
+        async def view(request):
+            self.reads.append(await sync_to_async(router.db_for_read)(Course))
+            return HttpResponse()
+
+        async_to_sync(ReplicaPinningMiddleware(view))(self.factory.get("/"))
+        self.assertEqual(self.reads, ["replica"])
+        self.assertEqual(lag.call_count, 1)
+
+    def test_pin_cache_must_be_shared(self):
+        self.assertEqual([error.id for error in check_replica_pin_cache(None)], ["courses.E001"])
+        with override_settings(CACHES=SHARED_AUTH_CACHE, REPLICA_PIN_CACHE_ALIAS="auth"):
+            self.assertEqual(check_replica_pin_cache(None), [])
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertEqual(check_replica_pin_cache(None), [])
+
+
+@override_settings(
+    SUPERUSER_USERNAME="admin", SUPERUSER_EMAIL="admin@example.com", SUPERUSER_PASSWORD="admin", CHANGE_FEED_SETTLE_SECONDS=0,
+)
+class SeedingTests(TestCase):
+    def migrate(self, app="courses"):
+        app_config = django_apps.get_app_config(app)
+        post_migrate.send(
+            sender=app_config, app_config=app_config, verbosity=0, interactive=False, using="default", apps=django_apps, plan=[],
+        )
+
+    def test_missing_rows_are_created_once(self):
+        Category.objects.filter(name__in=["iot", "devops"]).delete()
+        Group.objects.filter(name="Students").delete()
+        cursor = changes.latest_cursor()
+        with self.assertNumQueries(4):
+            # Existing names, insert, created ids and their change log entries
+            signals.create_default_categories(sender=None, using="default")
+        # Seeded categories reach the change feed like any other
+        self.assertEqual(
+            set(ChangeLog.objects.filter(id__gt=cursor).values_list("model", "action", "data__name")),
+            {("category", "created", "iot"), ("category", "created", "devops")},
+        )
+        self.migrate()
+        self.assertEqual(Category.objects.filter(name__in=[name for name, _ in DEFAULT_CATEGORIES]).count(), len(DEFAULT_CATEGORIES))
+        self.assertTrue(Group.objects.filter(name="Students").exists())
+
+        cursor = changes.latest_cursor()
+        with self.assertNumQueries(3):
+            # Groups, categories and the superuser
+            signals.crear_grupos_por_defecto(sender=None, using="default")
+            signals.create_default_categories(sender=None, using="default")
+            signals.create_superuser(sender=None, using="default", verbosity=0)
+        self.migrate()
+        self.assertEqual(changes.latest_cursor(), cursor)
+        self.assertEqual(User.objects.filter(username=settings.SUPERUSER_USERNAME).count(), 1)
+
+    def test_only_runs_for_the_courses_app(self):
+        Category.objects.filter(name="iot").delete()
+        self.migrate("auth")
+        self.assertFalse(Category.objects.filter(name="iot").exists())
+        self.migrate()
+        self.assertTrue(Category.objects.filter(name="iot").exists())
+
+    def test_seeds_the_migrated_database(self):
+        Category.objects.filter(name="iot").delete()
+        aliases = []
+
+        def redirect(manager):
+            # Only "default" exists in the tests, record the alias asked for
+            using = manager.using
+            return patch.object(manager, "using", side_effect=lambda alias: aliases.append(alias) or using("default"))
+
+        on_commit = transaction.on_commit
+        with redirect(Group.objects), redirect(Category.objects), redirect(ChangeLog.objects), redirect(User.objects), \
+                patch("courses.signals.transaction.on_commit", side_effect=lambda func, using: aliases.append(using) or on_commit(func)):
+            signals.crear_grupos_por_defecto(sender=None, using="other")
+            signals.create_default_categories(sender=None, using="other")
+            signals.create_superuser(sender=None, using="other", verbosity=0)
+        self.assertEqual(set(aliases), {"other"})
+        # Groups, categories (3), change log, cache invalidation and superuser
+        self.assertEqual(len(aliases), 7)
+        self.assertTrue(Category.objects.filter(name="iot").exists())
+
+
+class RoleTests(TestCase):
+    def setUp(self):
+        role_cache.clear()
+        self.professors = Group.objects.get(name="Professors")
+        self.user = User.objects.create(username="user")
+
+    def roles(self):
+        # A fresh user object, the roles are also kept on the instance for the request
+        return get_user_roles(User.objects.get(pk=self.user.pk))
+
+    @override_settings(ROLE_CACHE_TTL=60)
+    def test_roles_expire_after_ttl(self):
+        role_cache.set(self.user.pk, frozenset({"Students"}))
+        self.assertEqual(role_cache.get(self.user.pk), {"Students"})
+        with patch("courses.roles.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(role_cache.get(self.user.pk))
+        with override_settings(ROLE_CACHE_TTL=0):
+            role_cache.set(self.user.pk, frozenset())
+            self.assertIsNone(role_cache.get(self.user.pk))
+
+    @override_settings(ROLE_CACHE_MAXSIZE=2)
+    def test_least_recently_used_roles_are_evicted(self):
+        role_cache.set(1, frozenset())
+        role_cache.set(2, frozenset())
+        role_cache.get(1)
+        role_cache.set(3, frozenset())
+        self.assertIsNone(role_cache.get(2))
+        self.assertIsNotNone(role_cache.get(1))
+        self.assertIsNotNone(role_cache.get(3))
+
+    def test_group_changes_invalidate_roles(self):
+        self.assertEqual(self.roles(), frozenset())
+        with self.assertNumQueries(1):
+            self.roles()
+
+        self.user.groups.add(self.professors)
+        self.assertEqual(self.roles(), {"Professors"})
+        self.professors.user_set.remove(self.user)
+        self.assertEqual(self.roles(), frozenset())
+        self.professors.user_set.add(self.user)
+        self.assertEqual(self.roles(), {"Professors"})
+        self.professors.user_set.clear()
+        self.assertEqual(self.roles(), frozenset())
+
+        self.user.groups.add(self.professors)
+        self.roles()
+        self.professors.name = "Teachers"
+        self.professors.save()
+        self.assertEqual(self.roles(), {"Teachers"})
+        self.user.delete()
+        self.assertIsNone(role_cache.get(self.user.pk))
+
+    def test_professor_permissions_check_the_professors_group(self):
+        factory = RequestFactory()
+
+        def allowed(permission, method):
+            request = getattr(factory, method)("/")
+            request.user = User.objects.get(pk=self.user.pk)
+            return permission().has_permission(request, None)
+
+        self.user.groups.add(Group.objects.get(name="Students"), Group.objects.create(name="Teachers"))
+        self.assertFalse(allowed(IsProfessor, "get"))
+        self.assertTrue(allowed(IsProfessorOrReadOnly, "get"))
+        self.assertFalse(allowed(IsProfessorOrReadOnly, "post"))
+
+        self.user.groups.add(self.professors)
+        self.assertTrue(allowed(IsProfessor, "get"))
+        self.assertTrue(allowed(IsProfessorOrReadOnly, "post"))
+
+
+class CounterTests(APITestCase):
+    def test_enrollments_update_the_course_counter(self):
+        course = self.create_course()
+        users = User.objects.bulk_create([User(username=f"student{i}") for i in range(4)])
+        self.client.post(f"/api/courses/{course.id}/students/", {"user": users[0].id})
+        self.client.post(f"/api/courses/{course.id}/students/bulk/", {"users": [user.id for user in users]}, format="json")
+        course.refresh_from_db()
+        self.assertEqual(course.enrollment_count, 4)
+
+        student = Student.objects.filter(course=course).first()
+        self.client.delete(f"/api/courses/{course.id}/students/{student.id}/")
+        response = self.client.get(f"/api/courses/{course.id}/")
+        self.assertEqual(response.data["enrollment_count"], 3)
+
+    def test_courses_can_be_ordered_by_popularity(self):
+        popular, empty = self.create_course(name="Popular"), self.create_course(name="Empty")
+        Student.objects.create(user=User.objects.create(username="student"), course=popular)
+        response = self.client.get("/api/courses/?ordering=-enrollment_count")
+        self.assertEqual([course["name"] for course in response.data["results"]], ["Popular", "Empty"])
+
+    def test_category_counters_follow_course_categories(self):
+        first, second = Category.objects.all()[:2]
+        course = self.create_course(categories=[first, second])
+        course.categories.remove(second)
+        self.create_course(categories=[first])
+        first.refresh_from_db(), second.refresh_from_db()
+        self.assertEqual((first.course_count, second.course_count), (2, 0))
+
+        course.delete()
+        response = self.client.get(f"/api/categories/{first.id}/")
+        self.assertEqual(response.data["course_count"], 1)
+
+    def test_reconcile_fixes_drift(self):
+        course = self.create_course(categories=Category.objects.all()[:1])
+        Student.objects.create(user=User.objects.create(username="student"), course=course)
+        Course.objects.filter(pk=course.pk).update(enrollment_count=7)
+        Category.objects.update(course_count=3)
+
+        call_command("reconcile_counters", stdout=io.StringIO())
+        course.refresh_from_db()
+        self.assertEqual(course.enrollment_count, 1)
+        self.assertEqual(sorted(set(Category.objects.values_list("course_count", flat=True))), [0, 1])
+
+
+class BulkRelatedFieldTests(APITestCase):
+    def course_body(self, categories, professor=None):
+        return {
+            "name": "Course", "description": "Description", "start_date": "2025-09-01", "end_date": "2026-06-30",
+            "professor_id": (professor or self.professor).id, "categories": categories,
+        }
+
+    def test_course_creation_cost_does_not_grow_with_categories(self):
+        categories = list(Category.objects.values_list("id", flat=True))
+        # Warm the role and group caches
+        self.client.post("/api/courses/", self.course_body(categories[:1]), format="json")
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(self.client.post("/api/courses/", self.course_body(categories[:1]), format="json").status_code, 201)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post("/api/courses/", self.course_body(categories), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(many), len(one))
+        self.assertEqual(len(response.data["categories_details"]), len(categories))
+
+    def test_errors_match_primary_key_related_field(self):
+        category = Category.objects.first()
+        response = self.client.post("/api/courses/", self.course_body([category.id, 999999]), format="json")
+        self.assertEqual(response.data, {"categories": [ErrorDetail('Invalid pk "999999" - object does not exist.', "does_not_exist")]})
+
+        response = self.client.post("/api/courses/", self.course_body([True]), format="json")
+        self.assertEqual(response.data["categories"][0].code, "incorrect_type")
+
+        student = User.objects.create(username="student")
+        response = self.client.post("/api/courses/", self.course_body([category.id], professor=student), format="json")
+        self.assertEqual(response.data["professor_id"][0].code, "does_not_exist")
+
+    def test_list_serializer_loads_every_item_at_once(self):
+        users = User.objects.bulk_create([User(username=f"student{i}") for i in range(10)])
+        serializer = StudentSerializer(data=[{"user": user.id} for user in users], many=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual([item["user"] for item in serializer.validated_data], users)
+
+
+class CourseSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = self.create_course(name="Big Data", description="Análisis de datos masivos")
+        self.python = self.create_course(name="Python", description="Programación y big data")
+        self.other = self.create_course(name="Historia", description="Historia del arte")
+
+    def search(self, query):
+        response = self.client.get("/api/courses/search/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [course["name"] for course in response.data["results"]]
+
+    def test_results_are_ranked_by_relevance(self):
+        # Name matches come first
+        self.assertEqual(self.search("big data"), ["Big Data", "Python"])
+        self.assertEqual(self.search("analisis"), ["Big Data"])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(self.search("hist"), ["Historia"])
+        self.assertEqual(self.search("big da"), ["Big Data", "Python"])
+
+    def test_index_follows_course_changes(self):
+        self.other.name = "Pythonic history"
+        self.other.save()
+        self.python.delete()
+        self.assertEqual(self.search("python"), ["Pythonic history"])
+
+    def test_category_filter_and_pagination(self):
+        category = Category.objects.first()
+        self.python.categories.set([category])
+        response = self.client.get("/api/courses/search/", {"q": "data", "category": category.id})
+        self.assertEqual([course["name"] for course in response.data["results"]], ["Python"])
+
+        first = self.client.get("/api/courses/search/", {"q": "data", "page_size": 1})
+        second = self.client.get(first.data["next"])
+        self.assertEqual(
+            [first.data["results"][0]["name"], second.data["results"][0]["name"]], ["Big Data", "Python"]
+        )
+        self.assertIsNone(second.data["next"])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get("/api/courses/search/").status_code, 400)
+        self.assertEqual(self.search('"*'), [])
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course(name="Python", categories=Category.objects.all()[:2])
+        self.student = Student.objects.create(user=User.objects.create(username="student"), course=self.course)
+
+    def test_fields_narrow_payload_and_projection(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/courses/", {"fields": "id,name"})
+        self.assertEqual(response.data["results"], [{"id": self.course.id, "name": "Python"}])
+        # No description column and no categories query
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("description", queries[0]["sql"])
+
+        response = self.client.get(f"/api/courses/{self.course.id}/", {"fields": "name,start_date"})
+        self.assertEqual(response.data, {"name": "Python", "start_date": "2025-09-01"})
+
+    def test_expand_nests_related_objects(self):
+        professor = {"id": self.professor.id, "username": "professor"}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/courses/", {"fields": "id", "expand": "professor"})
+        self.assertEqual(response.data["results"], [{"id": self.course.id, "professor": professor}])
+        self.assertEqual(len(queries), 1)
+        response = self.client.get(f"/api/courses/{self.course.id}/", {"fields": "id", "expand": "professor"})
+        self.assertEqual(response.data, {"id": self.course.id, "professor": professor})
+
+        response = self.client.get(f"/api/courses/{self.course.id}/students/", {"fields": "user_username", "expand": "course"})
+        self.assertEqual(response.data["results"], [{"user_username": "student", "course": {"id": self.course.id, "name": "Python"}}])
+
+    def test_expanded_professor_follows_renames(self):
+        url = f"/api/courses/{self.course.id}/"
+        self.assertEqual(self.client.get(url, {"expand": "professor"}).data["professor"]["username"], "professor")
+        self.assertEqual(self.client.get("/api/courses/", {"expand": "professor"}).data["results"][0]["professor"]["username"], "professor")
+        self.professor.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professor.save()
+        self.assertEqual(self.client.get(url, {"expand": "professor"}).data["professor"]["username"], "renamed")
+        self.assertEqual(self.client.get("/api/courses/", {"expand": "professor"}).data["results"][0]["professor"]["username"], "renamed")
+
+    def test_unknown_names_are_rejected(self):
+        self.assertEqual(self.client.get("/api/courses/", {"fields": "id,secret"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/courses/", {"expand": "students"}).status_code, 400)
+        # Write only fields cannot be requested
+        self.assertEqual(self.client.get("/api/courses/", {"fields": "categories"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/users/", {"fields": "password"}).status_code, 400)
+
+    def test_user_fields(self):
+        response = self.client.get("/api/users/", {"fields": "id,username"})
+        self.assertIn({"id": self.professor.id, "username": "professor"}, response.data["results"])
+        self.assertEqual({len(user) for user in response.data["results"]}, {2})
+
+        response = self.client.get(f"/api/users/{self.professor.id}/", {"fields": "professor", "expand": "groups"})
+        self.assertEqual(response.data, {"professor": True, "groups": ["Professors"]})
+
+        response = self.client.get("/api/users/", {"fields": "username", "stream": "true"})
+        users = json.loads(b"".join(response.streaming_content))
+        self.assertIn({"username": "student"}, users)
+        self.assertEqual({len(user) for user in users}, {1})
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.professor.is_staff = True
+        self.professor.save()
+        self.cursor = self.client.get("/api/changes/").data["cursor"]
+
+    def feed(self, **params):
+        response = self.client.get("/api/changes/", {"since": self.cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        self.cursor = response.data["cursor"]
+        return [(change["model"], change["id"], change["action"]) for change in response.data["changes"]]
+
+    def test_changes_since_cursor(self):
+        categories = list(Category.objects.all()[:2])
+        course = self.create_course(name="Python", categories=categories)
+        user = User.objects.create(username="student")
+        student = Student.objects.create(user=user, course=course)
+        self.assertEqual(self.feed(), [
+            ("course", course.id, "created"),
+            ("course_category", course.id, "created"),
+            ("course_category", course.id, "created"),
+            ("student", student.id, "created"),
+        ])
+        self.assertEqual(self.feed(), [])
+
+        course.name = "Python 3"
+        course.save()
+        course.categories.remove(categories[0])
+        response = self.client.get("/api/changes/", {"since": self.cursor})
+        self.assertEqual(response.data["changes"][0]["data"]["name"], "Python 3")
+        self.assertEqual(response.data["changes"][1]["data"], {"course": course.id, "category": categories[0].id})
+
+    def test_deletes_leave_tombstones(self):
+        course = self.create_course()
+        student = Student.objects.create(user=User.objects.create(username="student"), course=course)
+        self.feed()
+        course_id = course.id
+        course.delete()
+        changes = self.client.get("/api/changes/", {"since": self.cursor}).data["changes"]
+        self.assertEqual(
+            {(change["model"], change["id"], change["action"], change["data"]) for change in changes},
+            {("student", student.id, "deleted", None), ("course", course_id, "deleted", None)},
+        )
+
+    def test_bulk_enrollments_and_filters(self):
+        course = self.create_course()
+        users = User.objects.bulk_create([User(username=f"student{i}") for i in range(3)])
+        self.client.post(f"/api/courses/{course.id}/students/bulk/", {"users": [user.id for user in users]}, format="json")
+        self.assertEqual(self.feed(models="student", limit=2), [("student", student.id, "created") for student in Student.objects.order_by("id")[:2]])
+        response = self.client.get("/api/changes/", {"since": self.cursor, "models": "student"})
+        self.assertEqual(len(response.data["changes"]), 1)
+        self.assertFalse(response.data["has_more"])
+        self.assertEqual(self.client.get("/api/changes/", {"since": 0, "models": "users"}).status_code, 400)
+
+    def test_recent_changes_are_held_back(self):
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.create_course()
+            self.assertEqual(self.feed(), [])
+        self.assertEqual(len(self.feed()), 1)
+
+    def test_pruned_cursor_is_gone(self):
+        self.create_course()
+        self.create_course()
+        ChangeLog.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        call_command("prune_changes", days=30, stdout=io.StringIO())
+        self.assertEqual(ChangeLogPrune.objects.get().pruned_through, self.cursor + 1)
+        self.assertEqual(self.client.get("/api/changes/", {"since": self.cursor}).status_code, 410)
+        self.assertEqual(len(self.client.get("/api/changes/", {"since": self.cursor + 1}).data["changes"]), 1)
+
+    def test_initial_cursor_leaves_out_unsettled_changes(self):
+        ChangeLog.objects.update(created_at=Now() - timezone.timedelta(minutes=2))
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            course = self.create_course()
+            self.cursor = self.client.get("/api/changes/").data["cursor"]
+            self.assertEqual(self.feed(), [])
+        self.assertEqual(self.feed(), [("course", course.id, "created")])
+
+    def test_gaps_in_ids_are_not_pruning(self):
+        self.create_course()
+        self.create_course()
+        # Entries of a rolled back transaction leave a gap at the start of the log
+        ChangeLog.objects.filter(id=self.cursor + 1).delete()
+        self.assertEqual(len(self.client.get("/api/changes/", {"since": self.cursor}).data["changes"]), 1)
+        self.assertEqual(prune_changes(30), 0)
+        self.assertEqual(ChangeLogPrune.objects.count(), 0)
+
+    def test_settle_uses_the_database_clock(self):
+        with override_settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.create_course()
+            with patch("django.utils.timezone.now", return_value=timezone.now() + timezone.timedelta(hours=1)):
+                self.assertEqual(self.feed(), [])
+            ChangeLog.objects.update(created_at=Now() - timezone.timedelta(minutes=2))
+            self.assertEqual(len(self.feed()), 1)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(User.objects.create(username="student"))
+        self.assertEqual(self.client.get("/api/changes/").status_code, 403)
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class CourseSimilarityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d = (self.create_course(name=name) for name in "ABCD")
+        self.users = User.objects.bulk_create([User(username=f"student{i}") for i in range(5)])
+        for user, courses in zip(self.users, [(self.a, self.b), (self.a, self.b), (self.a, self.c), (self.d,)]):
+            for course in courses:
+                Student.objects.create(user=user, course=course)
+
+    def similarities(self):
+        rows = CourseSimilarity.objects.order_by("course_id", "-score", "similar_course_id")
+        return [(row.course_id, row.similar_course_id, row.score) for row in rows]
+
+    def test_full_build(self):
+        call_command("build_course_similarities", stdout=io.StringIO())
+        # cosine = shared students / sqrt(students of each course)
+        self.assertEqual(self.similarities(), [
+            (self.a.id, self.b.id, 0.816497), (self.a.id, self.c.id, 0.57735),
+            (self.b.id, self.a.id, 0.816497), (self.c.id, self.a.id, 0.57735),
+        ])
+        call_command("build_course_similarities", top_k=1, min_common=2, stdout=io.StringIO())
+        self.assertEqual(self.similarities(), [(self.a.id, self.b.id, 0.816497), (self.b.id, self.a.id, 0.816497)])
+
+    def test_incremental_build_matches_full_build(self):
+        self.assertFalse(build_similarities(incremental=True).incremental)
+        Student.objects.create(user=self.users[3], course=self.c)
+        Student.objects.get(user=self.users[2], course=self.c).delete()
+        build = build_similarities(incremental=True)
+        self.assertTrue(build.incremental)
+        self.assertEqual(build.courses, 3)
+        incremental = self.similarities()
+        build_similarities()
+        self.assertEqual(incremental, self.similarities())
+        self.assertIn((self.d.id, self.c.id, 1.0), incremental)
+
+    def test_suggestions_merge_neighbors(self):
+        category = Category.objects.first()
+        self.b.categories.set([category])
+        other = self.create_course(name="Same category", categories=[category])
+        Student.objects.create(user=self.users[4], course=self.b)
+        build_similarities()
+        suggestion_index.build()
+        # Neighbors, page of courses and their categories
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/users/{self.users[4].id}/suggestions/")
+        self.assertEqual([course["name"] for course in response.data["suggested_courses"]], ["A", other.name])
+
+
+class SuggestionIndexTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.math, self.art = Category.objects.create(name="Math"), Category.objects.create(name="Art")
+        self.a = self.create_course(name="A", categories=[self.math])
+        self.b = self.create_course(name="B", categories=[self.math, self.art])
+        self.c = self.create_course(name="C", categories=[self.art])
+        self.user = User.objects.create(username="student")
+        Student.objects.create(user=self.user, course=self.a)
+
+    def test_build(self):
+        suggestion_index.build()
+        self.assertEqual(suggestion_index.enrolled_courses(self.user.id), {self.a.id})
+        self.assertEqual(suggestion_index.course_categories[self.b.id], {self.math.id, self.art.id})
+        self.assertEqual(suggestion_index.category_courses[self.art.id], {self.b.id, self.c.id})
+        self.assertEqual(suggestion_index.rank(self.user.id), [(self.b.id, 1)])
+
+    def test_receivers_update_the_built_index(self):
+        suggestion_index.build()
+        Student.objects.create(user=self.user, course=self.c)
+        self.b.categories.remove(self.math)
+        self.a.categories.add(self.art)
+        with self.assertNumQueries(0):
+            self.assertEqual(suggestion_index.rank(self.user.id), [(self.b.id, 1)])
+            self.assertEqual(suggestion_index.category_courses[self.art.id], {self.a.id, self.b.id, self.c.id})
+
+        Student.objects.get(user=self.user, course=self.c).delete()
+        self.art.delete()
+        self.c.categories.set([self.math])
+        with self.assertNumQueries(0):
+            self.assertEqual(suggestion_index.enrolled_courses(self.user.id), {self.a.id})
+            self.assertEqual(suggestion_index.rank(self.user.id), [(self.c.id, 1)])
+
+    @override_settings(SUGGESTIONS_INDEX_TTL=60)
+    def test_rebuilt_after_ttl(self):
+        index = SuggestionIndex()
+        index.build()
+        self.assertFalse(index.is_stale())
+        with patch("courses.suggestions.time.monotonic", return_value=index._built_at + 61):
+            self.assertTrue(index.is_stale())
+            # Students and course categories
+            with self.assertNumQueries(2):
+                index.ensure_built()
+            self.assertFalse(index.is_stale())
+
+    def test_updates_during_build_are_replayed(self):
+        index = SuggestionIndex()
+        through = Course.categories.through.objects.values_list("course_id", "category_id")
+
+        # Changes arriving after the enrollments were read, before the swap
+        def read_categories(chunk_size):
+            index.add_enrollment(self.user.id, self.c.id)
+            index.remove_enrollment(self.user.id, self.a.id)
+            index.remove_course_categories(self.b.id, {self.math.id})
+            return through.iterator(chunk_size=chunk_size)
+
+        with patch("courses.suggestions.Course") as course:
+            course.categories.through.objects.values_list.return_value.iterator.side_effect = read_categories
+            index.build()
+        self.assertEqual(index.enrolled_courses(self.user.id), {self.c.id})
+        self.assertEqual(index.course_categories[self.b.id], {self.art.id})
+        self.assertEqual(index.rank(self.user.id), [(self.b.id, 1)])
+
+    def test_one_build_at_a_time(self):
+        index = SuggestionIndex()
+        index.build()
+        index.invalidate()
+        index._built_at = 0
+        # A stale index answers while another thread refreshes it
+        with patch.object(index, "_build") as build:
+            index._build_lock.acquire()
+            index.ensure_built()
+            index._build_lock.release()
+            self.assertFalse(build.called)
+
+        # The first build is waited for and not repeated
+        index = SuggestionIndex()
+        index._build_lock.acquire()
+        waiter = threading.Thread(target=index.ensure_built)
+        with patch.object(index, "_build", wraps=index._build) as build:
+            waiter.start()
+            index._build()
+            index._build_lock.release()
+            waiter.join(5)
+        self.assertEqual(build.call_count, 1)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserImportTests(APITestCase):
+    password = "Str0ng-passw0rd"
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(User.objects.create(username="admin-user", is_staff=True))
+
+    def row(self, username, email=None, password=None, is_professor=False):
+        return {"username": username, "email": email or f"{username}@example.com", "password": password or self.password, "is_professor": is_professor}
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {result["username"]: result["status"] for result in response.data["skipped"]}
+
+    def test_json_import_validates_rows(self):
+        rows = [
+            self.row("ana", is_professor=True), self.row("Bob"), self.row("bob"), self.row("professor"),
+            self.row("a b!!"), self.row("x" * 151), self.row("eve", email="notanemail"), self.row("dan", password="p"),
+        ]
+        response = self.client.post("/api/users/bulk/", {"users": rows}, format="json")
+        self.assertEqual(self.statuses(response), {
+            "bob": "duplicate", "professor": "exists", "a b!!": "invalid", "x" * 151: "invalid",
+            "eve": "invalid", "dan": "invalid",
+        })
+        self.assertEqual(response.data["summary"], {"created": 2, "duplicate": 1, "exists": 1, "invalid": 4})
+        self.assertTrue(User.objects.get(username="ana").groups.filter(name="Professors").exists())
+        self.assertTrue(User.objects.get(username="Bob").check_password(self.password))
+
+    def test_csv_import(self):
+        body = f"username,email,password,is_professor\nana,ana@example.com,{self.password},true\nbea,,{self.password},no\n"
+        response = self.client.post("/api/users/bulk/", body.encode(), content_type="text/csv")
+        self.assertEqual(response.data["summary"], {"created": 2})
+        self.assertEqual(
+            set(User.objects.filter(username__in=["ana", "bea"]).values_list("username", "groups__name")),
+            {("ana", "Professors"), ("bea", "Students")},
+        )
+
+    def test_rejects_bodies_that_are_not_lists_of_users(self):
+        for body in ["abc", 5, None, {"users": 5}, {"users": "abc"}, [1, 2]]:
+            response = self.client.post("/api/users/bulk/", body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_import_resumes_from_batch(self):
+        batches = []
+        summary = import_users(
+            [self.row(f"user{i}") for i in range(5)], batch_size=2, workers=1, start_batch=1,
+            progress=lambda batch, results: batches.append((batch, [result["username"] for result in results])),
+        )
+        self.assertEqual(summary, {"created": 3})
+        self.assertEqual(batches, [(1, ["user2", "user3"]), (2, ["user4"])])
+        self.assertFalse(User.objects.filter(username__in=["user0", "user1"]).exists())
+
+    def test_command_writes_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path, checkpoint = f"{directory}/users.json", f"{directory}/checkpoint"
+            with open(path, "w") as file:
+                json.dump([self.row(f"user{i}") for i in range(3)] + [self.row("bad name!")], file)
+            output = io.StringIO()
+            call_command("import_users", path, batch_size=2, workers=1, checkpoint=checkpoint, stdout=output, stderr=io.StringIO())
+            with open(checkpoint) as file:
+                self.assertEqual(file.read(), "2")
+            self.assertIn("3 created, 1 invalid", output.getvalue())
+            # Resuming after the last batch imports nothing
+            call_command("import_users", path, batch_size=2, workers=1, checkpoint=checkpoint, stdout=output)
+        self.assertEqual(User.objects.filter(username__startswith="user").count(), 3)
+
+
+@override_settings(CACHES=SHARED_AUTH_CACHE, AUTH_CACHE_ALIAS="auth")
+class BenchmarkHarnessTests(TestCase):
+    def test_every_route_answers_with_the_expected_status(self):
+        suggestion_index.invalidate()
+        get_cache().clear()
+        context = benchmark.seed(users=20, professors=3, courses=5, categories=5, enrollments=40)
+        results = benchmark.run_benchmark(context, iterations=2, warmup=0)
+
+        self.assertEqual(set(results), {route.name for route in benchmark.ROUTES})
+        for name, stats in results.items():
+            self.assertEqual(stats["errors"], 0, name)
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_routes_cover_every_endpoint(self):
+        def views(patterns, prefix=""):
+            for pattern in patterns:
+                route = prefix + str(pattern.pattern)
+                if isinstance(pattern, URLResolver):
+                    yield from views(pattern.url_patterns, route)
+                elif route.startswith("api/"):
+                    yield pattern.callback
+
+        context = benchmark.seed(users=5, professors=2, courses=2, categories=2, enrollments=5)
+        context.update(run=0, refresh="")
+        # A different iteration per route, the objects they create must not collide
+        covered = {resolve(urlsplit(route.build(context, i)[0]).path).func for i, route in enumerate(benchmark.ROUTES)}
+        self.assertEqual(set(views(get_resolver().url_patterns)) - covered, set())
+
+    def test_auth_benchmark_compares_stacks(self):
+        context = benchmark.seed(users=5, professors=2, courses=2, categories=2, enrollments=5)
+        results = benchmark.run_auth_benchmark(context, iterations=2, warmup=1)
+
+        for stats in results.values():
+            self.assertEqual(stats["errors"], 0)
+        self.assertEqual(results["api policy (bearer+session)"]["queries_per_request"], 0)
+        self.assertEqual(results["session+token+jwt (bearer+session)"]["queries_per_request"], 2)
+
+    def test_connection_benchmark_restores_settings(self):
+        context = benchmark.seed(users=5, professors=2, courses=2, categories=2, enrollments=5)
+        settings_dict = dict(connection.settings_dict)
+        results = benchmark.run_connection_benchmark(context, iterations=2, warmup=1)
+
+        self.assertEqual(set(results), set(benchmark.CONNECTION_PROFILES))
+        for stats in results.values():
+            self.assertEqual(stats["errors"], 0)
+        self.assertEqual(connection.settings_dict, settings_dict)
@@ -1,18 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
-from .views import UsersListCreateView, UsersRetrieveDeleteView, PasswordUpdateView
+from .views import UsersListCreateView, UsersBulkCreateView, UsersRetrieveDeleteView, PasswordUpdateView
+from .views import TokenRevokeView
 from .views import CategoryListView, CategoryRetrieveView
-from .views import StudentListCreateView, StudentDestroyView
-from .views import SuggestionsGetView
+from .views import StudentListCreateView, StudentBulkCreateView, StudentDestroyView, StudentExportView
+from .views import SuggestionsGetView, CourseSearchView, ChangeFeedView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'courses', views.CourseViewSet)
 
 urlpatterns = [
+    # Before the router, which would take 'search' for a course id
+    path('api/courses/search/', CourseSearchView.as_view(), name='course-search'),
     path('api/', include(router.urls)),
 
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
+
     path('api/users/', UsersListCreateView.as_view(), name='user_detail'),
+    path('api/users/bulk/', UsersBulkCreateView.as_view(), name='users-bulk'),
     path('api/users/<int:pk>/', UsersRetrieveDeleteView.as_view(), name='user_detail'),
     path('api/users/<int:pk>/password/', PasswordUpdateView.as_view(), name='reset-password'),
     path('api/users/<int:user_id>/suggestions/',SuggestionsGetView.as_view(), name='suggestions'),
@@ -21,5 +28,17 @@ urlpatterns = [
     path('api/categories/<int:pk>/', CategoryRetrieveView.as_view(), name='category-detail'),
 
     path('api/courses/<int:course_id>/students/', StudentListCreateView.as_view(), name='course-students'),
+    path('api/courses/<int:course_id>/students/bulk/', StudentBulkCreateView.as_view(), name='course-students-bulk'),
+    path('api/courses/<int:course_id>/students/export/', StudentExportView.as_view(), name='course-students-export'),
+    path('api/students/export/', StudentExportView.as_view(), name='students-export'),
+    path('api/changes/', ChangeFeedView.as_view(), name='changes'),
     path('api/courses/<int:course_id>/students/<int:pk>/', StudentDestroyView.as_view(), name='delete-student'),
+
+    # Async versions of the read endpoints, for ASGI servers
+    path('api/async/categories/', async_views.AsyncCategoryListView.as_view(), name='async-category-list'),
+    path('api/async/categories/<int:pk>/', async_views.AsyncCategoryRetrieveView.as_view(), name='async-category-detail'),
+    path('api/async/courses/', async_views.AsyncCourseListView.as_view(), name='async-course-list'),
+    path('api/async/courses/<int:pk>/', async_views.AsyncCourseRetrieveView.as_view(), name='async-course-detail'),
+    path('api/async/courses/<int:course_id>/students/', async_views.AsyncStudentListView.as_view(), name='async-course-students'),
+    path('api/async/users/<int:user_id>/suggestions/', async_views.AsyncSuggestionsView.as_view(), name='async-suggestions'),
 ]
\ No newline at end of file
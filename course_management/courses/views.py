@@ -10,45 +10,104 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticate
 from .permissions import IsAdminUserOrProfessorOrReadOnly,IsProfessor, IsProfessorOrReadOnly, ReadOnlyForStudents, IsStudent
 
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
 
 from rest_framework.response import Response
-from rest_framework.exceptions import NotFound
-from rest_framework import status
-
-from django.contrib.auth.models import User
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework import serializers, status
+
+from django.contrib.auth.models import Group, User
+from django.db.models import Exists, OuterRef, Prefetch
+
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken, Token
+
+from .authentication import revoke_token
+from .cache import CATEGORIES, COURSES
+from .mixins import CachedReadMixin, QueryBudgetMixin, ValuesListMixin
+from .parsers import CSVParser, is_csv
+from .bulk import enroll_users, import_users
+from .filters import CourseFilterBackend, StudentFilterBackend
+from .queries import optimize_for_serializer, iter_values_in_batches
+from .renderers import NDJSONRenderer, CSVRenderer
+from .streaming import streaming_json_response, streaming_export_response
+from .suggestions import suggestion_index, get_suggestions, parse_page_params
+from .search import search_courses
+from . import changes
+from .sparse import SparseFieldsMixin, parse_field_list
 
 ###############
 #   CATEGORY  #
 ###############
 
 # View all categories
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(CachedReadMixin, ValuesListMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    ordering_fields = ('id', 'name', 'course_count')
+    cache_namespace = CATEGORIES
 
 # Query a category by ID
-class CategoryRetrieveView(generics.RetrieveAPIView):
+class CategoryRetrieveView(CachedReadMixin, generics.RetrieveAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    cache_namespace = CATEGORIES
 
 
 ###############
 #    USERS    #
 ###############
 
+# Annotate each user with whether they belong to the Professors group, in the same query
+def with_professor_flag(queryset):
+    professors = User.groups.through.objects.filter(user_id=OuterRef('pk'), group__name="Professors")
+    return queryset.annotate(is_professor=Exists(professors))
+
+# Fields of the user payloads, and the relations ?expand= can add
+USER_FIELDS = ('id', 'username', 'email', 'professor')
+USER_EXPANDABLE = ('groups',)
+
+# Fields requested with ?fields= and ?expand= (see sparse.py), in output order
+def get_user_fields(request):
+    fields = parse_field_list(request, 'fields')
+    expand = parse_field_list(request, 'expand') or frozenset()
+    if fields is not None and fields - set(USER_FIELDS):
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(fields - set(USER_FIELDS)))}."})
+    if expand - set(USER_EXPANDABLE):
+        raise ValidationError({'expand': f"Unknown expansions: {', '.join(sorted(expand - set(USER_EXPANDABLE)))}."})
+    return [name for name in USER_FIELDS if fields is None or name in fields] + sorted(expand)
+
+# Load only the columns and relations format_user_data() renders for `fields`
+def load_user_fields(queryset, fields, extra=()):
+    queryset = queryset.only('id', *extra, *(name for name in ('username', 'email') if name in fields))
+    if 'professor' in fields:
+        queryset = with_professor_flag(queryset)
+    if 'groups' in fields:
+        queryset = queryset.prefetch_related(Prefetch('groups', queryset=Group.objects.only('id', 'name')))
+    return queryset
+
 # Prevent code duplication when formatting the user data output for JSON
-def format_user_data(user):
-    return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "professor": user.groups.filter(name="Professors").exists(),
-    }
+def format_user_data(user, fields=USER_FIELDS):
+    data = {}
+    for name in fields:
+        if name == 'professor':
+            is_professor = getattr(user, 'is_professor', None)
+            if is_professor is None:
+                is_professor = user.groups.filter(name="Professors").exists()
+            data[name] = is_professor
+        elif name == 'groups':
+            data[name] = [group.name for group in user.groups.all()]
+        else:
+            data[name] = getattr(user, name)
+    return data
 
 # Create and retrieve the user list.
+# The list is cursor paginated; '/?stream=true' streams every user as a single JSON array instead.
+# '?fields=id,username' and '?expand=groups' choose the fields of each user
 class UsersListCreateView(generics.ListCreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    ordering_fields = ('id', 'username')
     
     def get_permissions(self):
         if self.request.method == "POST":
@@ -57,6 +116,8 @@ class UsersListCreateView(generics.ListCreateAPIView):
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = load_user_fields(queryset, get_user_fields(self.request), extra=self.ordering_fields)
 
         # Filter by teachers if '/?is_teacher=true' or students '/?is_teacher=false' is provided.
         is_professor = self.request.query_params.get("is_professor")
@@ -67,11 +128,23 @@ class UsersListCreateView(generics.ListCreateAPIView):
         return queryset
     
     def list(self, request, *args, **kwargs):
+        fields = get_user_fields(request)
         queryset = self.get_queryset()
+
+        if request.query_params.get("stream", "").lower() == "true":
+            if 'groups' in fields:
+                raise ValidationError({'expand': "Expansions are not available when streaming."})
+            columns = ['is_professor' if name == 'professor' else name for name in fields]
+            rows = queryset.order_by('id').values_list(*columns)
+            return streaming_json_response(
+                dict(zip(fields, row)) for row in rows.iterator(chunk_size=2000)
+            )
+
+        page = self.paginate_queryset(queryset)
         data = [
-            format_user_data(user) for user in queryset
+            format_user_data(user, fields) for user in page
         ]
-        return Response(data, status=status.HTTP_200_OK)
+        return self.get_paginated_response(data)
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -83,6 +156,35 @@ class UsersListCreateView(generics.ListCreateAPIView):
             status=status.HTTP_201_CREATED,
         )
     
+# Import many users at once (administrators only). The body is a JSON list of users,
+# {"users": [...]}, or a CSV file with a username,email,password,is_professor header.
+class UsersBulkCreateView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, CSVParser]
+
+    def get_rows(self, request):
+        data = request.data
+        if is_csv(request):
+            # CSV rows, the first one is the header
+            header = [column.strip() for column in next(data, [])]
+            return (dict(zip(header, row)) for row in data)
+        if isinstance(data, dict):
+            data = data.get("users")
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ValidationError({"users": "Expected a list of objects."})
+        return data
+
+    def post(self, request):
+        failed = []
+        # Hashed in this process: a pool per request, forked from a web worker, would
+        # multiply the processes with concurrent requests. The import_users command uses one
+        summary = import_users(
+            self.get_rows(request),
+            workers=1,
+            progress=lambda batch, results: failed.extend(result for result in results if result["status"] != "created"),
+        )
+        return Response({"summary": summary, "skipped": failed}, status=status.HTTP_200_OK)
+
 # Get and delete a user by ID    
 class UsersRetrieveDeleteView(generics.RetrieveDestroyAPIView):
     queryset = User.objects.all()
@@ -93,9 +195,15 @@ class UsersRetrieveDeleteView(generics.RetrieveDestroyAPIView):
             return [IsAdminUser()]
         return [AllowAny()]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = load_user_fields(queryset, get_user_fields(self.request))
+        return queryset
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        data = format_user_data(instance)
+        data = format_user_data(instance, get_user_fields(request))
         return Response(data, status=status.HTTP_200_OK)
 
 # Reset a password
@@ -117,32 +225,78 @@ class PasswordUpdateView(generics.UpdateAPIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Log out: revoke the access token of the request and the refresh token in the body, if any
+class TokenRevokeView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        if isinstance(request.auth, Token):
+            revoke_token(request.auth)
+        refresh = request.data.get("refresh")
+        if refresh:
+            try:
+                revoke_token(RefreshToken(refresh))
+            except TokenError as exc:
+                raise ValidationError({"refresh": str(exc)})
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 ###############
 #   COURSES   #
 ###############
 
 # Allows performing all basic operations on the course
-class CourseViewSet(viewsets.ModelViewSet):
+# The queryset loads exactly what CourseSerializer renders (categories are prefetched)
+# and list/retrieve payloads are cached until a course or category changes.
+# Reads take '?fields=id,name' and '?expand=professor' (see sparse.py)
+class CourseViewSet(QueryBudgetMixin, CachedReadMixin, SparseFieldsMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = [IsAdminUserOrProfessorOrReadOnly]
+    cache_namespace = COURSES
+    filter_backends = [CourseFilterBackend]
+    ordering_fields = ('id', 'start_date', 'end_date', 'name', 'enrollment_count')
+    query_budget = {'list': 4, 'retrieve': 4}
+
+    def get_queryset(self):
+        return optimize_for_serializer(super().get_queryset(), self.get_serializer())
 
-# Allows adding users to the course and viewing the course user list
-class StudentListCreateView(generics.ListCreateAPIView):
+# Ranked full-text search of courses by name and description (see search.py):
+#   ?q=  words to search, the last one also matches as a prefix (search as you type)
+# The course list filters (?category=...) apply too. Results come by relevance
+# with cursor pagination. ?fields= and ?expand= work as in the course list.
+class CourseSearchView(QueryBudgetMixin, SparseFieldsMixin, ValuesListMixin, generics.ListAPIView):
+    serializer_class = CourseSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [CourseFilterBackend]
+    ordering = 'rank'
+    ordering_fields = ('rank',)
+    query_budget = 2
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This parameter is required.'})
+        return search_courses(Course.objects.all(), text)
+
+# Allows adding users to the course and viewing the course user list.
+# The list takes '?fields=' and '?expand=course' (see sparse.py)
+class StudentListCreateView(SparseFieldsMixin, ValuesListMixin, generics.ListCreateAPIView):
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [StudentFilterBackend]
+    ordering_fields = ('id', 'created_at')
 
     def get_queryset(self):
         course_id = self.kwargs['course_id']
-        return Student.objects.filter(course_id=course_id)
+        return optimize_for_serializer(Student.objects.filter(course_id=course_id), self.get_serializer())
 
     def perform_create(self, serializer):
         course_id = self.kwargs['course_id']
         try:
             course = Course.objects.get(id=course_id)
         except Course.DoesNotExist:
-            raise Response({"detail": "Course not found."}, status=status.HTTP_404_NOT_FOUND)
+            raise NotFound(detail="Course not found.")
         serializer.save(course=course)
     
     def create(self, request, *args, **kwargs):
@@ -153,6 +307,39 @@ class StudentListCreateView(generics.ListCreateAPIView):
             status=status.HTTP_201_CREATED
         )
 
+# Enrolls many users at once. The body is either a JSON list of user ids, {"users": [...]},
+# or a CSV file whose first column holds the user ids (a header row is allowed).
+# Answers with the status of every submitted id.
+class StudentBulkCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, CSVParser]
+
+    def get_user_ids(self, request):
+        data = request.data
+        if is_csv(request):
+            # CSV rows: take the first column, skipping blank lines and a header row
+            return (
+                row[0].strip() for index, row in enumerate(data)
+                if row and row[0].strip() and not (index == 0 and not row[0].strip().isdigit())
+            )
+        if isinstance(data, dict):
+            data = data.get("users")
+        if not isinstance(data, list):
+            raise ValidationError({"users": "Expected a list of user ids."})
+        return data
+
+    def post(self, request, course_id):
+        course = Course.objects.filter(id=course_id).first()
+        if not course:
+            raise NotFound(detail="Course not found.")
+
+        results = enroll_users(course, self.get_user_ids(request))
+
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return Response({"summary": summary, "results": results}, status=status.HTTP_200_OK)
+
 # Allows deleting users
 class StudentDestroyView(generics.DestroyAPIView):
     queryset = Student.objects.all()
@@ -168,40 +355,105 @@ class StudentDestroyView(generics.DestroyAPIView):
         
         return student
 
-# Suggest courses to users with sames categories to the ones they are enrolled in
-class SuggestionsGetView(APIView):
-    def get(self, request, user_id):
-        try:
-            user = User.objects.filter(id=user_id).first()
-            if not user:
-                return Response({"detail":"User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-            students = Student.objects.filter(user=user)
-
-            if not students.exists():
-                return Response({"detail":"User is not enrolled in any of the courses."}, status=status.HTTP_404_NOT_FOUND)
-           
-            # Get the IDs of the courses the user is enrolled in
-            student_courses_ids = students.values_list('course', flat=True)
-            
-            # Get the categories of those courses, using distinct to ensure there are no duplicates
-            categories = Course.objects.filter(id__in=student_courses_ids).values_list('categories', flat=True).distinct()
-
-            # Search for other courses that belong to the same categories, and exclude the ones the student is already enrolled in
-            suggested_courses = Course.objects.filter(categories__in=categories).exclude(id__in=student_courses_ids).distinct()
-
-            if not suggested_courses.exists():
-                return Response({"detail": "No course suggestions found."}, status=status.HTTP_404_NOT_FOUND)
+# Export the students of a course, or the whole enrollment table (administrators only),
+# as NDJSON ('?format=ndjson', the default) or CSV ('?format=csv'). The rows are read in
+# batches of `batch_size` and streamed as they are encoded, so memory does not grow with
+# the size of the roster. The student filters (?created_after=, ?user=...) also apply.
+class StudentExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    filter_backends = [StudentFilterBackend]
+    batch_size = 2000
 
-            suggested_courses_list = [{
-                "name": course.name, 
-                "description": course.description, 
-                "categories": [category.name for category in course.categories.all()]}
-                  for course in suggested_courses]
+    def get_permissions(self):
+        if 'course_id' not in self.kwargs:
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def get(self, request, course_id=None):
+        queryset = Student.objects.all()
+        fields = ['id', 'user_id', 'user__username', 'created_at']
+        header = ['id', 'user', 'user_username', 'created_at']
+        filename = 'enrollments'
+
+        if course_id is not None:
+            if not Course.objects.filter(id=course_id).exists():
+                raise NotFound(detail="Course not found.")
+            queryset = queryset.filter(course_id=course_id)
+            filename = f'course_{course_id}_students'
+        else:
+            fields.insert(1, 'course_id')
+            header.insert(1, 'course')
+
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+
+        # Same datetime format as StudentSerializer
+        created_at = serializers.DateTimeField()
+        rows = (
+            row[:-1] + (created_at.to_representation(row[-1]),)
+            for row in iter_values_in_batches(queryset, fields, self.batch_size)
+        )
+        return streaming_export_response(rows, header, request.accepted_renderer.format, filename)
+
+# Change feed of courses, categories, enrollments and course categories, for
+# systems keeping a copy in sync (administrators only, see changes.py):
+#   ?since=   cursor of the last change seen, 0 for the whole log. Without it only
+#             the current cursor is returned, to follow the feed after a full pull
+#   ?models=  course,category,student,course_category (all by default)
+#   ?limit=   changes per page (500 by default, at most 5000)
+# Answers 410 when the changes after `since` were pruned: the consumer pulls everything again.
+class ChangeFeedView(APIView):
+    permission_classes = [IsAdminUser]
 
-            return Response({
-                "suggested_courses": suggested_courses_list
-            }, status=status.HTTP_200_OK)
+    def get_int(self, request, name, default, maximum=None):
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+        if value < 0:
+            raise ValidationError({name: "Must be 0 or more."})
+        return value if maximum is None else min(value, maximum)
+
+    def get(self, request):
+        if "since" not in request.query_params:
+            return Response({"changes": [], "cursor": changes.latest_cursor(), "has_more": False})
+        since = self.get_int(request, "since", 0)
+        limit = self.get_int(request, "limit", changes.DEFAULT_LIMIT, changes.MAX_LIMIT) or changes.DEFAULT_LIMIT
+
+        models = parse_field_list(request, "models")
+        if models is not None and models - set(changes.MODELS):
+            raise ValidationError({"models": f"Unknown models: {', '.join(sorted(models - set(changes.MODELS)))}."})
+
+        if changes.is_expired(since):
+            return Response({"detail": "Changes after this cursor were pruned, pull everything again."}, status=status.HTTP_410_GONE)
+
+        entries, cursor, has_more = changes.read_changes(since, limit, models)
+        return Response({"changes": entries, "cursor": cursor, "has_more": has_more})
+
+# Suggest courses to users with sames categories to the ones they are enrolled in.
+# Courses taken by the students of the user's courses come first (see similarity.py),
+# then courses ranked by the number of categories they share with the user's courses,
+# served from the in-memory index in suggestions.py, paginated with ?limit= and ?offset=
+class SuggestionsGetView(APIView):
+    def get(self, request, user_id):
+        limit, offset = parse_page_params(request.query_params)
 
-        except Student.DoesNotExist:
-            return Response({"detail": "Student not found."}, status=status.HTTP_404_NOT_FOUND)
+        if not suggestion_index.enrolled_courses(user_id):
+            if not User.objects.filter(id=user_id).exists():
+                return Response({"detail":"User not found."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"detail":"User is not enrolled in any of the courses."}, status=status.HTTP_404_NOT_FOUND)
+
+        total, suggested_courses_list = get_suggestions(user_id, limit, offset)
+        if not total:
+            return Response({"detail": "No course suggestions found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "count": total,
+            "limit": limit,
+            "offset": offset,
+            "suggested_courses": suggested_courses_list
+        }, status=status.HTTP_200_OK)